@@ -2,37 +2,33 @@ import glob
 import os
 import math
 import pandas as pd
+import util
 import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-
-def readCSV(folder_path):
-    all_files = os.listdir(folder_path)
-    all_dfs = {}
-    for file_name in all_files:
-        if file_name.endswith('.csv'):
-            file_path = os.path.join(folder_path, file_name)
-            df = pd.read_csv(file_path, index_col=None, header=0)
-            df['date'] = pd.to_datetime(df['timestamp'], unit='s')
-            df.set_index('date', inplace=True)
-            # Sort and drop duplicate indices, keeping the first occurrence
-            df_unique = df.sort_index().loc[~df.index.duplicated(keep='first')]
-            # Filter for February 2025 and later
-            all_dfs[file_name] = df_unique[df_unique.index >= '2025-07-10']
-
+from storage_scripts.candle_store import CandleStore
+from storage_scripts.csv_loader import loadCSVDir
+
+def readCSV(folder_path, start_date='2025-07-10', compact=False):
+    # Parallel pyarrow load, rows before start_date are dropped while parsing
+    all_dfs = loadCSVDir(folder_path, start=start_date)
+    if compact:
+        all_dfs = {name: util.compactCandles(df, verbose=False) for name, df in all_dfs.items()}
     return all_dfs
 
+def readStore(start_date='2025-07-10', store=None, granularity=None):
+    # Store partitions are already sorted and deduplicated, same keys as readCSV
+    # granularity=86400 reads the daily rollup instead of the hourly candles
+    store = store or CandleStore()
+    dfs = store.readMany(start=start_date, as_frame=True, granularity=granularity)
+    return {f"{product_id}.csv": df for product_id, df in dfs.items() if not df.empty}
+
 def getVWAP(df):
-    # Step 1: Calculate the Typical Price for each row
-    df['typical_price'] = (df['high'] + df['low'] + df['close']) / 3
-    # Step 2: Calculate Price x Volume
-    df['Price x Volume'] = df['typical_price'] * df['volume']
-    # Step 3: Calculate Cumulative Price x Volume and Cumulative Volume
-    df['Cumulative Price x Volume'] = df['Price x Volume'].cumsum()
-    df['Cumulative Volume'] = df['volume'].cumsum()
-    # Step 4: Calculate VWAP
-    return df['Cumulative Price x Volume'] / df['Cumulative Volume']
+    # Typical price x volume, accumulated in float64 so float32 frames keep precision
+    typical_price = (df['high'] + df['low'] + df['close']) / 3
+    price_volume = (typical_price * df['volume']).astype('float64')
+    return price_volume.cumsum() / df['volume'].astype('float64').cumsum()
 
 # time for timestamp, refactor this method
 def normalizeData(df, option=2):
@@ -116,11 +112,16 @@ def filterPairs(coins_dict, coin_names):
 
 def showCandles():
     folder_path = "data/historical_data/"
-    dataframes_dict = readCSV(folder_path)
+    # plotSimple only shows daily closes
+    dataframes_dict = readStore(granularity=86400)
+    if not dataframes_dict:
+        dataframes_dict = readCSV(folder_path)
     # coins_sel = ["BTC-USD", "ADA-USD", "ETH-USD"]
     # filtered = filterPairs(dataframes_dict, coins_sel)
     plotCandles(dataframes_dict, plots_per_fig = 5)
 
-showCandles()
-plt.show()
+# Guarded, the CSV loader starts worker processes that import this module
+if __name__ == "__main__":
+    showCandles()
+    plt.show()
 # Show plot
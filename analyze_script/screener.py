@@ -0,0 +1,109 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+import api_scripts.get_request as api_get
+from storage_scripts.candle_store import CandleStore
+
+HOUR = 3600
+
+
+@dataclass
+class Metric:
+    """
+    A column of the screen. kind "change" is price / close hours_ago - 1, kind "vs_average"
+    is price / mean close of the window_hours candles starting hours_ago.
+    """
+    name: str
+    kind: str
+    hours_ago: int
+    window_hours: int = 1
+
+
+# today_past: current price against the 24 hours that started a week ago, plus the 24h change
+DEFAULT_METRICS = [
+    Metric("vs_avg_7d", "vs_average", 7 * 24, 24),
+    Metric("change_24h", "change", 24),
+    Metric("change_7d", "change", 7 * 24),
+]
+
+
+def closeMatrix(candles: Dict[str, np.ndarray], start_ts: int, end_ts: int) -> np.ndarray:
+    """(pairs, hours) closes on the hourly grid [start_ts, end_ts), NaN where a pair has no candle"""
+    n_hours = (end_ts - start_ts) // HOUR
+    matrix = np.full((len(candles), n_hours), np.nan)
+    for row, array in enumerate(candles.values()):
+        columns = (array["timestamp"] - start_ts) // HOUR
+        inside = (columns >= 0) & (columns < n_hours)
+        matrix[row, columns[inside]] = array["close"][inside]
+    return matrix
+
+
+def snapshotPrices(product_ids: List[str], use_oracle: bool = True) -> np.ndarray:
+    """Mid price of every pair from one oracle read or one bulk best bid/ask call, NaN if missing"""
+    quotes = api_get.getCurrentBestBidAsk(product_ids, use_oracle=use_oracle) or {}
+    prices = np.full(len(product_ids), np.nan)
+    for i, product_id in enumerate(product_ids):
+        quote = quotes.get(product_id)
+        if not quote:
+            continue
+        if "mid" in quote:
+            prices[i] = quote["mid"]
+        elif quote.get("bids") and quote.get("asks"):
+            prices[i] = (float(quote["bids"][0]["price"]) + float(quote["asks"][0]["price"])) / 2
+    return prices
+
+
+def computeMetrics(matrix: np.ndarray, prices: np.ndarray, metrics: Iterable[Metric]) -> Dict[str, np.ndarray]:
+    """Every metric for every pair at once, the last matrix column is the newest closed hour"""
+    n_hours = matrix.shape[1]
+    columns = {}
+    for metric in metrics:
+        start = n_hours - metric.hours_ago
+        if start < 0:
+            raise ValueError(f"{metric.name} looks back further than the loaded {n_hours} hours")
+        if metric.kind == "change":
+            columns[metric.name] = prices / matrix[:, start] - 1
+        elif metric.kind == "vs_average":
+            window = matrix[:, start:start + metric.window_hours]
+            counts = np.sum(~np.isnan(window), axis=1)
+            # Pairs without a candle in the window get NaN and fail every rule
+            average = np.where(counts > 0, np.nansum(window, axis=1) / np.maximum(counts, 1), np.nan)
+            columns[metric.name] = prices / average
+        else:
+            raise ValueError(f"Unknown metric kind {metric.kind}")
+    return columns
+
+
+def screen(product_ids: Optional[List[str]] = None, rules: Optional[str] = None,
+           metrics: Iterable[Metric] = DEFAULT_METRICS, store: Optional[CandleStore] = None,
+           use_oracle: bool = True, refresh: bool = True) -> pd.DataFrame:
+    """
+    Metrics of all pairs as a frame indexed by pair, filtered by rules, a DataFrame.query
+    expression over the metric names like "vs_avg_7d < 1.2 and change_24h > 0". Candles come
+    from the candle store (refresh tops it up first), the current price from one snapshot,
+    pairs without a live price fall back to their last stored close.
+    """
+    store = store or CandleStore()
+    product_ids = list(product_ids) if product_ids is not None else store.products()
+    metrics = list(metrics)
+    lookback_hours = max(metric.hours_ago for metric in metrics)
+    now = int(time.time())
+    end_ts = now - now % HOUR
+    start_ts = end_ts - lookback_hours * HOUR
+    if refresh:
+        api_get.fillStore(store, product_ids, start_ts, end_ts)
+    matrix = closeMatrix(store.readMany(product_ids, start_ts, end_ts), start_ts, end_ts)
+
+    prices = snapshotPrices(product_ids, use_oracle)
+    # Last stored close per pair for the ones the snapshot missed
+    last_seen = np.where(np.isnan(matrix), -1, np.arange(matrix.shape[1])).max(axis=1)
+    last_close = np.where(last_seen >= 0, matrix[np.arange(len(product_ids)), last_seen], np.nan)
+    live = ~np.isnan(prices)
+    prices = np.where(live, prices, last_close)
+
+    result = pd.DataFrame({"price": prices, "live_price": live, **computeMetrics(matrix, prices, metrics)},
+                          index=pd.Index(product_ids, name="pair"))
+    return result.query(rules) if rules else result
+
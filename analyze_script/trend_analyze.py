@@ -6,32 +6,54 @@ from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import api_scripts.get_request as api_get
 import util
+from storage_scripts.candle_store import CandleStore
+from storage_scripts.universe import Universe, STABLE_COINS, MIN_VOLUME
+
+_universe = None
+
+def get_universe():
+    # Built on first use, importing the module does not touch the store
+    global _universe
+    if _universe is None:
+        # Run from analyze_script, data lives one folder up
+        _universe = Universe(CandleStore("../data/candle_store"), "../data/universe.json")
+    return _universe
 
 def filterVolume(df, largest_n=10):
-    df["usd_volume"] = df.volume * df.close
-    usd_volumes = df.groupby("pair")["usd_volume"].sum()
+    # USD volume as a separate series, the input frame is left untouched
+    usd_volume = df.volume.astype("float64") * df.close
+    usd_volumes = usd_volume.groupby(df["pair"], observed=True).sum()
     top_n = usd_volumes.nlargest(largest_n).index.tolist()
-    # Step 2: Filter rows that contain any of these keywords
-    pattern = '|'.join(top_n)
-    filtered_df = df[df['pair'].str.contains(pattern, case=False, na=False)]
-    return filtered_df
+    return df[df["pair"].isin(top_n)]
 
 def get_pairs():
-    ids_path = "../data/coin_pairs_vol_100m_30days.pkl"
-    ids_list = util.readPickle(ids_path)
+    universe = get_universe()
+    universe.refresh()
+    usd_ids = universe.pairs(MIN_VOLUME, quote="USD", exclude_bases=STABLE_COINS)
+    if usd_ids:
+        return usd_ids
+    # Empty candle store, fall back to the static selection
+    ids_list = util.readPickle("../data/coin_pairs_vol_100m_30days.pkl")
     usd_ids = []
-    stable_coin = {"USDT", "USDC", "DAI", "TUSD", "EUR", "GBP", "BUSD"}
     for pair in ids_list:
         base, second = pair.split("-")
-        if base not in stable_coin and second.endswith("USD"):
+        if base not in STABLE_COINS and second.endswith("USD"):
             usd_ids.append(pair)
     return usd_ids
 
-def get_price_history(coin_id, days=7):
-    historical_data_df = api_get.getPriceHistory(coin_id, days, granularity_unit=3600, df_return=True)
-    filtered_df = filterVolume(historical_data_df)# days
+def get_price_history(coin_id, days=7, largest_n=10):
+    # The universe already ranks the pairs, only the top ones are fetched
+    universe = get_universe()
+    top_ids = universe.top(largest_n, among=coin_id)
+    historical_data_df = api_get.getPriceHistory(top_ids or coin_id, days, granularity_unit=3600, df_return=True,
+                                                 store=universe.store)
+    # Categorical pairs and float32 prices, wide universes otherwise do not fit in memory
+    historical_data_df = util.compactCandles(historical_data_df)
+    filtered_df = historical_data_df if top_ids else filterVolume(historical_data_df, largest_n)
     # Pivot so each pair is a column and index is timestamp
     pivot_df = filtered_df.pivot(index='timestamp', columns='pair', values='close')
+    # compactCandles stores epoch seconds, the plots want dates on the axis
+    pivot_df.index = pd.to_datetime(pivot_df.index, unit="s")
     # Drop pairs with too much missing data if necessary
     pivot_df = pivot_df.dropna(thresh=int(0.9 * len(pivot_df)), axis=1)
     return pivot_df
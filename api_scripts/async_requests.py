@@ -0,0 +1,238 @@
+import time
+import asyncio
+import datetime
+import aiohttp
+import api_scripts.authenticate as auth
+import api_scripts.get_request as api_get
+import api_scripts.post_requests as post_req
+
+
+def expandParams(params):
+    """aiohttp wants repeated keys for list params, requests does this implicitly"""
+    if not params:
+        return None
+    expanded = []
+    for key, value in params.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        expanded.extend((key, str(item)) for item in values)
+    return expanded
+
+
+class AsyncCoinbaseClient:
+    """
+    asyncio counterpart of get_request and post_requests with the same method names.
+    One pooled session is shared by all calls and a semaphore caps requests in flight.
+
+    async with AsyncCoinbaseClient(max_concurrency=10) as client:
+        books = await client.gatherOrderBooks(["BTC-USD", "ETH-USD"])
+    """
+
+    def __init__(self, max_concurrency=10, pool_size=20):
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size)
+        self.session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def _request(self, method, url, retry_server_errors=True, **kwargs):
+        """Mirrors get_request.sendRequest, returns (status, parsed json or text)"""
+        for attempt in range(api_get.MAX_RETRIES + 1):
+            try:
+                async with self.semaphore:
+                    async with self.session.request(method, url, **kwargs) as response:
+                        status = response.status
+                        retry_after = response.headers.get("Retry-After")
+                        try:
+                            data = await response.json(content_type=None)
+                        except ValueError:
+                            data = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # A dropped connection is retried like in sendRequest instead of failing the gather
+                if attempt == api_get.MAX_RETRIES or \
+                        not api_get.isIdempotent(method, retry_server_errors, kwargs.get("json")):
+                    raise
+                print(f"Connection error for {url}: {e!r}")
+                await asyncio.sleep(api_get.RETRY_BACKOFF * 2 ** attempt)
+                continue
+
+            retryable = status == 429 or (retry_server_errors and status >= 500)
+            if not retryable or attempt == api_get.MAX_RETRIES:
+                return status, data
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = api_get.RETRY_BACKOFF * 2 ** attempt
+            await asyncio.sleep(delay)
+        return status, data
+
+    # ---- Advanced api ----
+    async def getApiAdvanced(self, endpoint, params=None):
+        jwt_token = auth.getJWT("GET", "api.coinbase.com", endpoint)
+        headers = {
+            "Authorization": f"Bearer {jwt_token}",
+            "Content-Type": "application/json"
+        }
+        status, data = await self._request("GET", api_get.ADVANCED_BASE_URL + endpoint,
+                                           headers=headers, params=expandParams(params))
+        if status == 200:
+            return data
+        print(f"Error: {status}, {data}")
+        return None
+
+    async def postApiAdvanced(self, endpoint, body_content):
+        """Unlike the sync version the response is returned instead of printed"""
+        jwt_token = auth.postJWT("POST", "api.coinbase.com", endpoint, body_content)
+        headers = {
+            "Authorization": f"Bearer {jwt_token}",
+            "Content-Type": "application/json"
+        }
+        status, data = await self._request("POST", api_get.ADVANCED_BASE_URL + endpoint,
+                                           retry_server_errors=False, headers=headers, json=body_content)
+        if status != 200:
+            print(f"Error: {status}, {data}")
+        return data
+
+    async def getPortfolio(self, min_value_usdc=50, fiat_currency="USD", include_holds=False, return_ids=False):
+        portfolio_data = await self.getApiAdvanced("/api/v3/brokerage/accounts")
+        balances = api_get.portfolioBalances(portfolio_data, fiat_currency, include_holds)
+        # All prices are requested concurrently instead of one by one
+        prices = await asyncio.gather(*(self.getCurrentPrice(product_id) for product_id in balances))
+        items_included = {}
+        for (product_id, (balance, total_balance)), current_price in zip(balances.items(), prices):
+            total_value = total_balance * current_price if current_price else 0
+            if total_value > min_value_usdc:
+                items_included[product_id] = balance
+
+        if return_ids:
+            return items_included, list(items_included.keys())
+        return items_included
+
+    async def getProductInfo(self, product_id):
+        return await self.getApiAdvanced(f"/api/v3/brokerage/products/{product_id}")
+
+    async def getCurrentPrice(self, product_id):
+        price_dict = await self.getApiAdvanced(f"/api/v3/brokerage/products/{product_id}/ticker")
+        return api_get.tickerSpotPrice(price_dict) if price_dict else None
+
+    async def getCurrentBestBidAsk(self, product_ids):
+        all_prices = await self.getApiAdvanced("/api/v3/brokerage/best_bid_ask")
+        return {dict_info["product_id"]: dict_info for dict_info in all_prices["pricebooks"]
+                if dict_info["product_id"] in product_ids}
+
+    async def getOrders(self, end_point_param, params=None):
+        return await self.getApiAdvanced(f"/api/v3/brokerage/{end_point_param}", params)
+
+    async def iterOrders(self, **filters):
+        """Async generator over every page of orders/historical/batch"""
+        params = {"limit": 250}
+        params.update({key: value for key, value in filters.items() if value is not None})
+        for key in ("start_date", "end_date"):
+            params[key] = api_get.toRFC3339(params.get(key))
+        params = {key: value for key, value in params.items() if value is not None}
+        while True:
+            page = await self.getOrders("orders/historical/batch", params)
+            if not page:
+                return
+            for order in page.get("orders", []):
+                yield order
+            cursor = page.get("cursor")
+            if not page.get("has_next") or not cursor or cursor == params.get("cursor"):
+                return
+            params = {**params, "cursor": cursor}
+
+    # ---- Exchange api ----
+    async def _getExchange(self, url):
+        status, data = await self._request("GET", url, headers={'Accept': 'application/json'})
+        if status == 200 and data:
+            return data
+        print(f"Request failed with status code {status} for {url}, {data}")
+        return None
+
+    async def getAPIData(self, base_url, product_ids, url_param):
+        is_single_id = isinstance(product_ids, str)
+        if is_single_id:
+            product_ids = [product_ids]
+        responses = await asyncio.gather(*(self._getExchange(base_url.format(product_id, url_param))
+                                           for product_id in product_ids))
+        results = {product_id: data for product_id, data in zip(product_ids, responses) if data}
+        return results if not is_single_id else results.get(product_ids[0])
+
+    async def getOrderBook(self, product_id="BTC-USD", detail_level=2):
+        return await self.getAPIData(api_get.PRODUCTS_URL, product_id, f"book?level={detail_level}")
+
+    async def getPriceHistory(self, coin_pair_ids, days_ago, granularity_unit=3600, df_return=False,
+                              candles_per_request=300):
+        """All candles of the last days_ago days, 300 candle windows of every pair are requested concurrently"""
+        is_single_id = isinstance(coin_pair_ids, str)
+        product_ids = [coin_pair_ids] if is_single_id else list(coin_pair_ids)
+        end_ts = int(time.time())
+        start_ts = end_ts - int(days_ago * 86400)
+        window = granularity_unit * candles_per_request
+        url_params = [f"candles?granularity={granularity_unit}"
+                      f"&start={datetime.datetime.utcfromtimestamp(slice_start).isoformat()}"
+                      f"&end={datetime.datetime.utcfromtimestamp(min(slice_start + window, end_ts)).isoformat()}"
+                      for slice_start in range(start_ts, end_ts, window)]
+        responses = await asyncio.gather(*(self.getAPIData(api_get.PRODUCTS_URL, product_ids, url_param)
+                                           for url_param in url_params))
+        historical_data = {}
+        for product_id in product_ids:
+            # Window ends are inclusive on the exchange, duplicates are dropped, newest first
+            candles = {candle[0]: candle for response in responses for candle in response.get(product_id, [])}
+            if candles:
+                historical_data[product_id] = [candles[ts] for ts in sorted(candles, reverse=True)]
+        if df_return:
+            return api_get.convertDF(historical_data)
+        return historical_data if not is_single_id else historical_data.get(coin_pair_ids)
+
+    # ---- Orders ----
+    async def placeLimitOrder(self, pair_id, limit_price, base_size, side, client_order_id=None):
+        order_payload = post_req.limitOrderPayload(pair_id, limit_price, base_size, side, client_order_id)
+        return await self.postApiAdvanced("/api/v3/brokerage/orders", order_payload)
+
+    async def placeStopLimitOrder(self, pair_id, stop_price, limit_price, base_size, side, client_order_id=None):
+        order_payload = post_req.stopLimitOrderPayload(pair_id, stop_price, limit_price, base_size, side,
+                                                       client_order_id)
+        return await self.postApiAdvanced("/api/v3/brokerage/orders", order_payload)
+
+    async def buyLimitOrder(self, pair_id, limit_price, base_size):
+        return await self.placeLimitOrder(pair_id, limit_price, base_size, "BUY")
+
+    async def sellLimitOrder(self, pair_id, limit_price, base_size):
+        return await self.placeLimitOrder(pair_id, limit_price, base_size, "SELL")
+
+    async def cancelOrder(self, cancel_side="SELL", cancel_order_type="STOP_LIMIT"):
+        orders = [order async for order in self.iterOrders(order_status=["OPEN"], order_side=cancel_side,
+                                                             order_types=[cancel_order_type])]
+        delete_payload = {"order_ids": post_req.selectCancelIds(orders, cancel_side, cancel_order_type)}
+        return await self.postApiAdvanced("/api/v3/brokerage/orders/batch_cancel", delete_payload)
+
+    # ---- Bulk helpers ----
+    async def gatherProductInfo(self, product_ids):
+        infos = await asyncio.gather(*(self.getProductInfo(product_id) for product_id in product_ids))
+        return dict(zip(product_ids, infos))
+
+    async def gatherOrderBooks(self, product_ids, detail_level=2):
+        books = await asyncio.gather(*(self.getOrderBook(product_id, detail_level) for product_id in product_ids))
+        return dict(zip(product_ids, books))
+
+    async def placeOrders(self, orders):
+        """
+        Places many orders in one go, orders is a list of dicts with a "type" of
+        "limit" or "stop_limit" and the keyword arguments of the matching method.
+        Failures are returned in place of the response.
+        """
+        calls = []
+        for order in orders:
+            kwargs = {key: value for key, value in order.items() if key != "type"}
+            if order.get("type", "limit") == "stop_limit":
+                calls.append(self.placeStopLimitOrder(**kwargs))
+            else:
+                calls.append(self.placeLimitOrder(**kwargs))
+        return await asyncio.gather(*calls, return_exceptions=True)
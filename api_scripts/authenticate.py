@@ -51,4 +51,14 @@ def postJWT(request_method, request_host, request_path, body_data):
     }
     jwt_token = build_jwt(jwt_payload)
 
-    return jwt_token
\ No newline at end of file
+    return jwt_token
+
+def getWebsocketJWT():
+    "JWT for the authenticated websocket channels, same claims as getJWT without the request uri."
+    jwt_payload = {
+        'sub': API_KEY_ID,
+        'iss': "cdp",
+        'nbf': int(time.time()),
+        'exp': int(time.time()) + 120,
+    }
+    return build_jwt(jwt_payload)
@@ -1,11 +1,65 @@
 import json,requests
+import os
+import time
 import datetime
 import api_scripts.authenticate as auth
+import util
 import pandas as pd
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Base urls can point at a local stand-in (api_scripts/replay_server.py) for offline runs
+ADVANCED_BASE_URL = os.getenv("COINBASE_ADVANCED_URL", "https://api.coinbase.com")
+EXCHANGE_BASE_URL = os.getenv("COINBASE_EXCHANGE_URL", "https://api.exchange.coinbase.com")
+# First {} is product id, second the url param string
+PRODUCTS_URL = EXCHANGE_BASE_URL + "/products/{}/{}"
+MAX_RETRIES = int(os.getenv("COINBASE_MAX_RETRIES", "3"))
+RETRY_BACKOFF = 0.5 # seconds, doubled every retry
+
+# Local price oracle served by the websocket tracker (websocket_scripts/price_oracle.py)
+ORACLE_URL = os.getenv("PRICE_ORACLE_URL", "http://127.0.0.1:8765")
+ORACLE_MAX_AGE = 5.0 # seconds, older books fall back to REST
+oracle_session = requests.Session()
+
+def isIdempotent(method, retry_server_errors, body=None):
+    """Whether a request that may have reached the server can safely be sent again"""
+    if method.upper() == "GET" or retry_server_errors:
+        return True
+    return isinstance(body, dict) and bool(body.get("client_order_id"))
+
+def sendRequest(method, url, retry_server_errors=True, **kwargs):
+    """
+    requests.request with retries on 429 (honouring Retry-After) and, when allowed, on 5xx.
+    Connection errors are retried for idempotent requests only, a POST counts as idempotent
+    when its body carries a client_order_id. Returns the last response so callers keep
+    their own status handling.
+    """
+    response = None
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.ConnectionError as e:
+            if attempt == MAX_RETRIES or not isIdempotent(method, retry_server_errors, kwargs.get("json")):
+                raise
+            print(f"Connection error for {url}: {e}")
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+            continue
+
+        retryable = response.status_code == 429 or (retry_server_errors and response.status_code >= 500)
+        if not retryable or attempt == MAX_RETRIES:
+            return response
+        retry_after = response.headers.get("Retry-After")
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = RETRY_BACKOFF * 2 ** attempt
+        time.sleep(delay)
+    return response
+
 """
 Method below are using a base url for the advanced coinbase api
 """
-def getApiAdvanced(endpoint):
+def getApiAdvanced(endpoint, params=None):
     "Fetches the latest price for a given product ID from Coinbase Advanced Trade API."
     request_method = "GET"
     request_host = "api.coinbase.com"
@@ -15,9 +69,9 @@ def getApiAdvanced(endpoint):
         "Authorization": f"Bearer {jwt_token}",
         "Content-Type": "application/json"
     }
-    base_url = "https://api.coinbase.com"
-    url = base_url + endpoint
-    response = requests.get(url, headers=headers)
+    url = ADVANCED_BASE_URL + endpoint
+    # Query params stay out of the JWT uri, Coinbase signs the path only
+    response = sendRequest("GET", url, headers=headers, params=params)
 
     if response.status_code == 200:
         data = response.json()
@@ -26,11 +80,27 @@ def getApiAdvanced(endpoint):
         print(f"Error: {response.status_code}, {response.text}")
         return None
 
-def getPortfolio(min_value_usdc=50, fiat_currency="USD", include_holds=False, return_ids=False):
+def getPortfolio(min_value_usdc=50, fiat_currency="USD", include_holds=False, return_ids=False,
+                 use_oracle=False):
     "Fetches the latest price for a given product ID from Coinbase Advanced Trade API."
     endpoint = f"/api/v3/brokerage/accounts"
     portfolio_data = getApiAdvanced(endpoint)
     items_included = {}
+    balances = portfolioBalances(portfolio_data, fiat_currency, include_holds)
+    for product_id, (balance, total_balance) in balances.items():
+        current_price = getCurrentPrice(product_id, use_oracle=use_oracle)
+        # Also include what is currently on hold due to open orders
+        total_value = total_balance * current_price if current_price else 0
+        if total_value > min_value_usdc:
+            items_included[product_id] = balance
+
+    if return_ids:
+        return items_included, list(items_included.keys())
+    return items_included
+
+def portfolioBalances(portfolio_data, fiat_currency="USD", include_holds=False):
+    "Available and total balance per non fiat trade pair of an accounts response."
+    balances = {}
     fiats = ["USD", "USDC", "EUR", "GBP", "JPY", "AUD", "CAD"]
     for account in portfolio_data.get('accounts', []):
         balance = float(account['available_balance']['value'])
@@ -45,24 +115,59 @@ def getPortfolio(min_value_usdc=50, fiat_currency="USD", include_holds=False, re
         if any(fiat in currency for fiat in fiats):
             # Skip fiat currencies
             continue
-        product_id = f"{currency}-{fiat_currency}"
-        current_price = getCurrentPrice(product_id)
-        # Also include what is currently on hold due to open orders
-        total_value = total_balance * current_price if current_price else 0
-        if total_value > min_value_usdc:
-            items_included[product_id] = balance
+        balances[f"{currency}-{fiat_currency}"] = (balance, total_balance)
+    return balances
 
-    if return_ids:
-        return items_included, list(items_included.keys())
-    return items_included
 def getProductInfo(product_id):
     "Get Product details "
     endpoint = f"/api/v3/brokerage/products/{product_id}"
     return getApiAdvanced(endpoint)
-def getCurrentPrice(product_id):
+def getOracleQuotes(product_ids, depth=1, max_age=ORACLE_MAX_AGE):
+    """
+    Reads best bid/ask, mid, spread and top-N depth from the local price oracle.
+    Returns a dict keyed by product id with only fresh books, or {} if the oracle is down.
+    """
+    params = {"product_ids": ",".join(product_ids), "depth": depth}
+    try:
+        response = oracle_session.get(f"{ORACLE_URL}/quotes", params=params, timeout=0.5)
+    except requests.RequestException:
+        return {}
+    if response.status_code != 200:
+        print(f"Oracle error: {response.status_code}, {response.text}")
+        return {}
+
+    result = {}
+    for dict_info in response.json().get("pricebooks", []):
+        if dict_info["age"] <= max_age and dict_info["bids"] and dict_info["asks"]:
+            result[dict_info["product_id"]] = dict_info
+    return result
+
+def getTrackedOrders(status="OPEN", side=None, order_type=None, product_id=None):
+    """
+    Live orders from the websocket user channel index behind the price oracle.
+    Returns None when the tracker is not running so callers can fall back to REST.
+    """
+    params = {"status": status, "side": side, "order_type": order_type, "product_id": product_id}
+    params = {key: value for key, value in params.items() if value is not None}
+    try:
+        response = oracle_session.get(f"{ORACLE_URL}/orders", params=params, timeout=0.5)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    return response.json()["orders"]
+
+def getCurrentPrice(product_id, use_oracle=False):
     "Fetches the latest price for a given product ID from Coinbase Advanced Trade API."
+    if use_oracle:
+        quote = getOracleQuotes([product_id]).get(product_id)
+        if quote:
+            return quote["mid"]
     endpoint = f"/api/v3/brokerage/products/{product_id}/ticker"
     price_dict = getApiAdvanced(endpoint)
+    return tickerSpotPrice(price_dict)
+
+def tickerSpotPrice(price_dict):
     bid_price = price_dict["best_bid"]
     ask_price = price_dict["best_ask"]
     if not bid_price or not ask_price:
@@ -70,26 +175,84 @@ def getCurrentPrice(product_id):
     else:
         spot_price = (float(bid_price) + float(ask_price)) / 2
     return spot_price
-def getCurrentBestBidAsk(product_ids):
+def getCurrentBestBidAsk(product_ids, use_oracle=False):
     "Fetches the latest price for a given product ID from Coinbase Advanced Trade API."
-    product_list = ','.join(product_ids)
+    result = getOracleQuotes(product_ids) if use_oracle else {}
+    missing_ids = [product_id for product_id in product_ids if product_id not in result]
+    if not missing_ids:
+        return result
+
     endpoint = f"/api/v3/brokerage/best_bid_ask"
     all_prices = getApiAdvanced(endpoint)
     # filter out what we need, this works without getting 401
-    result = {}
     for dict_info in all_prices["pricebooks"]:
         product_id = dict_info['product_id']
-        if product_id in product_ids:
+        if product_id in missing_ids:
             result[product_id] = dict_info
     return result
 
-def getOrders(end_point_param):
+def getOrders(end_point_param, params=None):
     """Fetches open orders from Coinbase Advanced Trade API."""
     request_method = "GET"
     request_host = "api.coinbase.com"
     endpoint = f"/api/v3/brokerage/{end_point_param}"
 
-    return getApiAdvanced(endpoint)
+    return getApiAdvanced(endpoint, params)
+
+def toRFC3339(date):
+    if date is None or isinstance(date, str):
+        return date
+    if date.tzinfo is None:
+        return date.isoformat() + "Z"
+    return date.isoformat()
+
+def iterPages(end_point_param, items_key, params=None):
+    """
+    Yields every item of a cursor paginated endpoint.
+    The next page is requested in the background while the current one is consumed.
+    """
+    params = {key: value for key, value in (params or {}).items() if value is not None}
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(getOrders, end_point_param, params)
+        previous_cursor = None
+        while future is not None:
+            page = future.result()
+            if not page:
+                return
+            cursor = page.get("cursor")
+            # fills only returns a cursor, orders also has has_next
+            has_next = page.get("has_next", bool(cursor))
+            future = None
+            if has_next and cursor and cursor != previous_cursor:
+                future = executor.submit(getOrders, end_point_param, {**params, "cursor": cursor})
+            previous_cursor = cursor
+            yield from page.get(items_key, [])
+
+def iterOrders(product_ids=None, order_status=None, start_date=None, end_date=None,
+               order_side=None, order_types=None, order_ids=None, limit=250):
+    """Streams orders/historical/batch with server side filters, e.g. order_status=["OPEN"]"""
+    params = {
+        "order_ids": order_ids,
+        "product_ids": product_ids,
+        "order_status": order_status,
+        "order_side": order_side,
+        "order_types": order_types,
+        "start_date": toRFC3339(start_date),
+        "end_date": toRFC3339(end_date),
+        "limit": limit,
+    }
+    return iterPages("orders/historical/batch", "orders", params)
+
+def iterFills(product_ids=None, start_date=None, end_date=None, order_ids=None, limit=250):
+    """Streams orders/historical/fills with server side filters"""
+    params = {
+        "product_ids": product_ids,
+        "order_ids": order_ids,
+        "start_sequence_timestamp": toRFC3339(start_date),
+        "end_sequence_timestamp": toRFC3339(end_date),
+        "limit": limit,
+    }
+    return iterPages("orders/historical/fills", "fills", params)
 
 """
 First method made for coinbase base exchange
@@ -115,7 +278,7 @@ def getAPIData(base_url, product_ids, url_param, headers=None):
     results = {}
     for product_id in product_ids:
         url = base_url.format(product_id, url_param)
-        response = requests.get(url, headers=headers)
+        response = sendRequest("GET", url, headers=headers)
 
         if response.status_code == 200:  # Only process successful responses
             try:
@@ -130,8 +293,26 @@ def getAPIData(base_url, product_ids, url_param, headers=None):
     return results if not is_single_id else results.get(product_ids[0])
 
 
+def getCandles(product_id, timestamp_start, timestamp_end, granularity_unit=3600):
+    """
+    One candles request (max 300 candles) as [[ts, low, high, open, close, volume], ...].
+    Unlike getAPIData an empty window returns [] and a failed request None.
+    """
+    url_param = f"candles?granularity={granularity_unit}&start={timestamp_start}&end={timestamp_end}"
+    url = PRODUCTS_URL.format(product_id, url_param)
+    response = sendRequest("GET", url, headers={'Accept': 'application/json'})
+    if response.status_code != 200:
+        print(f"Request failed with status code {response.status_code} for ID {product_id}, {response.content}")
+        return None
+    try:
+        return response.json()
+    except json.JSONDecodeError:
+        print(f"Failed to parse JSON for ID {product_id}")
+        return None
+
+
 def getOrderBook(product_id="BTC-USD", detail_level=2):
-    base_url = 'https://api.exchange.coinbase.com/products/{}/{}'
+    base_url = PRODUCTS_URL
     # level three gets entire order book
     url_param = f"book?level={detail_level}"
     # return dict with key id and values per timestamp
@@ -140,36 +321,153 @@ def getOrderBook(product_id="BTC-USD", detail_level=2):
     return order_books
 
 
-def getPriceHistory(coin_pair_ids, days_ago, granularity_unit=3600, df_return=False):
-    days_ago_limit = min(12, days_ago) # max 300 candles so actually depends on our granularity unit
-    timestamp_start = datetime.datetime.now() - pd.DateOffset(days=days_ago_limit)
+def subtractRanges(ranges, removed):
+    """[a, b) ranges minus the sorted, non overlapping [c, d) ranges of removed"""
+    result = []
+    for a, b in ranges:
+        for c, d in removed:
+            if d <= a or c >= b:
+                continue
+            if c > a:
+                result.append((a, c))
+            a = max(a, d)
+            if a >= b:
+                break
+        if b > a:
+            result.append((a, b))
+    return result
+
+
+def missingSlices(meta, start_ts, end_ts, granularity_unit=3600, candles_per_request=300, empty_ranges=()):
+    """
+    Grid aligned request windows covering what the store lacks between start_ts and end_ts:
+    everything before its first candle, after its last candle and its known gaps.
+    empty_ranges ([a, b), sorted) came back empty before, listing or trade free hours, and are skipped.
+    """
+    if not meta:
+        missing = [(start_ts, end_ts)]
+    else:
+        missing = [(start_ts, min(end_ts, meta["min_ts"]))] + \
+                  [(max(start_ts, a + granularity_unit), min(end_ts, b)) for a, b in meta["gaps"]] + \
+                  [(max(start_ts, meta["max_ts"] + granularity_unit), end_ts)]
+    window = granularity_unit * candles_per_request
+    slices = set()
+    for a, b in subtractRanges(missing, empty_ranges):
+        if b > a:
+            slices.update(range(a - a % window, b, window))
+    return [(slice_start, slice_start + window) for slice_start in sorted(slices)]
+
+
+def emptyHours(candles, slice_start, slice_end, granularity_unit=3600):
+    """[a, b) ranges of the fetched window [slice_start, slice_end) without a candle"""
+    empty = []
+    next_ts = slice_start
+    for ts in sorted(candle[0] for candle in candles if slice_start <= candle[0] < slice_end):
+        if ts > next_ts:
+            empty.append([next_ts, ts])
+        next_ts = ts + granularity_unit
+    if slice_end > next_ts:
+        empty.append([next_ts, slice_end])
+    return empty
+
+
+def fillStore(store, product_ids, start_ts, closed_ts, granularity_unit=3600, max_workers=8):
+    """
+    Fetches what the candle store lacks between start_ts and closed_ts, concurrently over all pairs.
+    Hours a successful request returned no candle for (before the listing, without trades, the
+    tail up to closed_ts) are remembered as empty, so repeated calls only request new hours.
+    """
+    requests_todo = [(product_id, slice_start, min(slice_end, closed_ts))
+                     for product_id in product_ids
+                     for slice_start, slice_end in missingSlices(store.metadata(product_id), start_ts, closed_ts,
+                                                                 granularity_unit,
+                                                                 empty_ranges=store.emptyRanges(product_id))]
+    # (product_id, [a, b)) appended from the worker threads
+    empty = []
+
+    def fetch(request):
+        product_id, slice_start, slice_end = request
+        candles = getCandles(product_id, datetime.datetime.utcfromtimestamp(slice_start).isoformat(),
+                             datetime.datetime.utcfromtimestamp(slice_end).isoformat(), granularity_unit)
+        # A failed request says nothing about its hours, they are requested again next time
+        if candles is None:
+            return
+        # The end is inclusive on the exchange, the open candle at closed_ts stays out
+        candles = [candle for candle in candles if candle[0] < closed_ts]
+        if candles:
+            store.append(product_id, candles)
+        empty.extend((product_id, hours) for hours in emptyHours(candles, slice_start, slice_end, granularity_unit))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(fetch, requests_todo))
+
+    empty_ranges = defaultdict(list)
+    for product_id, hours in empty:
+        empty_ranges[product_id].append(hours)
+    store.addEmptyRanges(empty_ranges)
+    return len(requests_todo)
+
+
+def getPriceHistory(coin_pair_ids, days_ago, granularity_unit=3600, df_return=False, use_cache=True, store=None):
+    """
+    Candles of the last days_ago days per pair as {pair: [[ts, low, high, open, close, volume], ...]}.
+    Hourly candles are served from the local candle store, only the missing head, tail and
+    gaps are fetched (concurrently) and written back, so there is no 300 candle cap.
+    """
     timestamp_end = datetime.datetime.now()
-    url_param = f"candles?granularity={granularity_unit}&start={timestamp_start}&end={timestamp_end}"
-    base_url = 'https://api.exchange.coinbase.com/products/{}/{}'
-    # return dict with key id and values per timestamp
-    historical_data = getAPIData(base_url, coin_pair_ids, url_param)
+    if not use_cache or granularity_unit != 3600:
+        days_ago_limit = min(12, days_ago) # max 300 candles so actually depends on our granularity unit
+        timestamp_start = timestamp_end - pd.DateOffset(days=days_ago_limit)
+        url_param = f"candles?granularity={granularity_unit}&start={timestamp_start}&end={timestamp_end}"
+        base_url = PRODUCTS_URL
+        # return dict with key id and values per timestamp
+        historical_data = getAPIData(base_url, coin_pair_ids, url_param)
+        if df_return:
+            historical_data = convertDF(historical_data)
+        return historical_data
+
+    from storage_scripts.candle_store import CandleStore
+    store = store or CandleStore()
+    is_single_id = isinstance(coin_pair_ids, str)
+    product_ids = [coin_pair_ids] if is_single_id else list(coin_pair_ids)
+    end_ts = int(timestamp_end.timestamp())
+    # Plain epoch arithmetic, a naive pd.Timestamp would be read as UTC and shift the window
+    start_ts = end_ts - int(days_ago * 86400)
+    # Keep the newest, still forming candle out of the store
+    closed_ts = end_ts - end_ts % granularity_unit
+
+    fillStore(store, product_ids, start_ts, closed_ts, granularity_unit)
+
+    historical_data = {}
+    for product_id, candles in store.readMany(product_ids, start_ts, closed_ts).items():
+        if candles.size:
+            # Newest first like the candles endpoint
+            historical_data[product_id] = [list(row) for row in candles[::-1].tolist()]
     if df_return:
-        historical_data = convertDF(historical_data)
+        return convertDF(historical_data)
+    return historical_data if not is_single_id else historical_data.get(coin_pair_ids)
 
-    return historical_data
 
-def convertDF(dict_data):
-    # Convert to a list of rows
-    rows = []
-    for pair, timestamp_values in dict_data.items():
-        for values in timestamp_values:
-            timestamp, open_, high, low, close, volume = values
-            dt = datetime.datetime.utcfromtimestamp(timestamp)  # Convert to readable date
-            rows.append([pair, dt, open_, high, low, close, volume])
-    # Create DataFrame
-    return pd.DataFrame(rows, columns=["pair", "timestamp", "open", "high", "low", "close", "volume"])
+def convertDF(dict_data, compact=False):
+    # Candles are [ts, low, high, open, close, volume], converted column wise
+    df = util.candlesToFrame(dict_data)
+    return util.compactCandles(df) if compact else df
+
+def getProductStats():
+    "24 hour and 30 day stats of every product in one call, keyed by product id"
+    url = f'{EXCHANGE_BASE_URL}/products/stats'
+    response = sendRequest("GET", url, headers={'Accept': 'application/json'})
+    if response.status_code != 200:
+        print(f"Request failed with status code {response.status_code} for {url}")
+        return None
+    return response.json()
 
 def getTradePairs(fiat_currency="USD"):
-    url = f'https://api.exchange.coinbase.com/products/'
+    url = f'{EXCHANGE_BASE_URL}/products/'
     headers = {
        'Accept': 'application/json'
     }
-    response = requests.get(url, headers=headers)
+    response = sendRequest("GET", url, headers=headers)
     trade_pairs = json.loads(response.text)
 
     fiat_pairs = [
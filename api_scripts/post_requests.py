@@ -1,10 +1,10 @@
 import json, requests
 import api_scripts.authenticate as auth
 import uuid
-from api_scripts.get_request import getApiAdvanced
+from api_scripts.get_request import iterOrders, getTrackedOrders, sendRequest, ADVANCED_BASE_URL
 
-def postApiAdvanced(endpoint, body_content):
-    "Fetches the latest price for a given product ID from Coinbase Advanced Trade API."
+def postApiAdvanced(endpoint, body_content, verbose=True):
+    "Posts to the Coinbase Advanced Trade API and returns the response."
     request_method = "POST"
     request_host = "api.coinbase.com"
     jwt_token = auth.postJWT(request_method, request_host, endpoint, body_content)
@@ -13,23 +13,22 @@ def postApiAdvanced(endpoint, body_content):
         "Authorization": f"Bearer {jwt_token}",
         "Content-Type": "application/json"
     }
-    base_url = "https://api.coinbase.com"
-    url = base_url + endpoint
-    response = requests.post(url, headers=headers, json=body_content)
+    url = ADVANCED_BASE_URL + endpoint
+    # Only retry 429s, a 5xx might still have placed the order
+    response = sendRequest("POST", url, retry_server_errors=False, headers=headers, json=body_content)
 
     # === PRINT RESULT ===
-    print("Status Code:", response.status_code)
-    try:
-        print(json.dumps(response.json(), indent=2))
-    except:
-        print(response.text)
+    if verbose:
+        print("Status Code:", response.status_code)
+        try:
+            print(json.dumps(response.json(), indent=2))
+        except:
+            print(response.text)
+    return response
 
-# TODO consolidate the two methods into one
-def placeLimitOrder(pair_id, limit_price, base_size, side):
-    endpoint = f"/api/v3/brokerage/orders"
-    # ==== Create order body ====
-    order_payload = {
-        "client_order_id": str(uuid.uuid4()),
+def limitOrderPayload(pair_id, limit_price, base_size, side, client_order_id=None):
+    return {
+        "client_order_id": client_order_id or str(uuid.uuid4()),
         "product_id": pair_id + "C",
         "side": side,
         "order_configuration": {
@@ -41,14 +40,9 @@ def placeLimitOrder(pair_id, limit_price, base_size, side):
         }
     }
 
-    postApiAdvanced(endpoint, order_payload)
-
-
-def placeStopLimitOrder(pair_id, stop_price, limit_price, base_size, side):
-    endpoint = f"/api/v3/brokerage/orders"
-    # ==== Create order body ====
-    order_payload = {
-        "client_order_id": str(uuid.uuid4()),
+def stopLimitOrderPayload(pair_id, stop_price, limit_price, base_size, side, client_order_id=None):
+    return {
+        "client_order_id": client_order_id or str(uuid.uuid4()),
         "product_id": pair_id + "C",
         "side": side,
         "order_configuration": {
@@ -60,20 +54,59 @@ def placeStopLimitOrder(pair_id, stop_price, limit_price, base_size, side):
         }
     }
 
+def placeLimitOrder(pair_id, limit_price, base_size, side):
+    endpoint = f"/api/v3/brokerage/orders"
+    order_payload = limitOrderPayload(pair_id, limit_price, base_size, side)
     postApiAdvanced(endpoint, order_payload)
+
+
+def placeStopLimitOrder(pair_id, stop_price, limit_price, base_size, side):
+    endpoint = f"/api/v3/brokerage/orders"
+    order_payload = stopLimitOrderPayload(pair_id, stop_price, limit_price, base_size, side)
+    postApiAdvanced(endpoint, order_payload)
+
 def buyLimitOrder(pair_id, limit_price, base_size):
     placeLimitOrder(pair_id, limit_price, base_size, "BUY")
 
 def sellLimitOrder(pair_id, limit_price, base_size):
     placeLimitOrder(pair_id, limit_price, base_size, "SELL")
 
-def cancelOrder(cancel_side="SELL",cancel_order_type="STOP_LIMIT"):
-    "Fetches the latest price for a given product ID from Coinbase Advanced Trade API."
-    get_endpoint = f"/api/v3/brokerage/orders/historical/batch"
+def cancelOrder(cancel_side="SELL",cancel_order_type="STOP_LIMIT", use_tracker=False):
+    "Cancels all open orders of one side and type."
+    orders = None
+    if use_tracker:
+        # Answered from the websocket user channel index when the tracker runs
+        orders = getTrackedOrders(status="OPEN", side=cancel_side, order_type=cancel_order_type)
+    if orders is None:
+        # Only open orders of the wanted side and type are requested
+        orders = iterOrders(order_status=["OPEN"], order_side=cancel_side, order_types=[cancel_order_type])
+    cancelOrderIds(selectCancelIds(orders, cancel_side, cancel_order_type))
+
+def cancelOrderIds(order_ids, verbose=True):
+    "Batch cancels order ids, in chunks of the 100 ids batch_cancel accepts."
     post_endpoint = f"/api/v3/brokerage/orders/batch_cancel"
-    delete_payload = {"order_ids": []}
-    portfolio_data = getApiAdvanced(get_endpoint)
-    orders = portfolio_data.get('orders', [])
+    responses = []
+    for i in range(0, len(order_ids), 100):
+        delete_payload = {"order_ids": order_ids[i:i + 100]}
+        responses.append(postApiAdvanced(post_endpoint, delete_payload, verbose))
+    return responses
+
+def cancelledIds(responses):
+    "Order ids the batch_cancel responses report as cancelled, failed requests cancel none."
+    cancelled = set()
+    for response in responses:
+        if response is None or response.status_code != 200:
+            continue
+        try:
+            results = response.json().get("results", [])
+        except ValueError:
+            continue
+        cancelled.update(result["order_id"] for result in results
+                         if result.get("success") and result.get("order_id"))
+    return cancelled
+
+def selectCancelIds(orders, cancel_side="SELL", cancel_order_type="STOP_LIMIT"):
+    order_ids = []
     for order in orders:
         side = order.get('side', '').upper()
         status = order.get('status', '').upper()
@@ -86,6 +119,5 @@ def cancelOrder(cancel_side="SELL",cancel_order_type="STOP_LIMIT"):
             product_id = order.get('product_id', "")
             if order_id:
                 print("Try to delete:", product_id)
-                delete_payload["order_ids"].append(order_id)
-
-    postApiAdvanced(post_endpoint, delete_payload)
+                order_ids.append(order_id)
+    return order_ids
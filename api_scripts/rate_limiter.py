@@ -0,0 +1,25 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Thread safe token bucket, acquire() blocks until a request may be sent"""
+
+    def __init__(self, rate_per_sec: float = 10.0, burst: int = 10):
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate_per_sec)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate_per_sec
+            time.sleep(wait_time)
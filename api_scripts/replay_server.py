@@ -0,0 +1,213 @@
+"""
+Record/replay stand-in for the Coinbase REST api
+================================================
+
+Record once against the live api, then replay offline with injected latency,
+server errors and 429s to benchmark or regression test api_scripts.
+
+    python -m api_scripts.replay_server --mode record
+    python -m api_scripts.replay_server --mode replay --latency-ms 80 --rate-limit-rate 0.05
+
+Point the REST layer at it with
+    COINBASE_ADVANCED_URL=http://127.0.0.1:8080 COINBASE_EXCHANGE_URL=http://127.0.0.1:8080
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+from urllib.parse import urlparse, parse_qsl, urlencode
+import requests
+
+ADVANCED_UPSTREAM = "https://api.coinbase.com"
+EXCHANGE_UPSTREAM = "https://api.exchange.coinbase.com"
+# Request headers forwarded upstream while recording, never stored
+FORWARD_HEADERS = ("Authorization", "Content-Type", "Accept")
+# Response fields replaced before a recording is written to disk
+SCRUB_KEYS = {"uuid", "user_id", "retail_portfolio_id", "portfolio_id", "account_id", "client_order_id"}
+# Query params that change every call (candle windows) and are ignored for matching
+VOLATILE_PARAMS = {"start", "end", "cursor"}
+
+
+def scrub(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: "scrubbed" if key in SCRUB_KEYS else scrub(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [scrub(item) for item in value]
+    return value
+
+
+def requestKey(method: str, path: str, query: str, strict: bool = True) -> str:
+    params = sorted(parse_qsl(query, keep_blank_values=True))
+    if not strict:
+        params = [(key, value) for key, value in params if key not in VOLATILE_PARAMS]
+    return f"{method} {path}?{urlencode(params)}"
+
+
+class Cassette:
+    """Recorded responses keyed by request, replayed round-robin per key"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.positions: Counter = Counter()
+        if path.exists():
+            self.entries.update(json.loads(path.read_text(encoding="utf-8")))
+
+    def add(self, key: str, status_code: int, body: str) -> None:
+        try:
+            body = json.dumps(scrub(json.loads(body)))
+        except json.JSONDecodeError:
+            pass
+        with self.lock:
+            self.entries[key].append({"status": status_code, "body": body})
+
+    def find(self, method: str, path: str, query: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            for key in (requestKey(method, path, query), requestKey(method, path, query, strict=False)):
+                responses = self.entries.get(key)
+                if responses:
+                    response = responses[self.positions[key] % len(responses)]
+                    self.positions[key] += 1
+                    return response
+        return None
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            self.path.write_text(json.dumps(self.entries, indent=1), encoding="utf-8")
+
+
+class ReplayServer:
+    def __init__(self, cassette_path: str = "data/replay/cassette.json", mode: str = "replay",
+                 host: str = "127.0.0.1", port: int = 8080, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.cassette = Cassette(Path(cassette_path))
+        self.mode = mode
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.stats: Counter = Counter()
+        self.httpd: Optional[ThreadingHTTPServer] = None
+
+    def _upstream(self, path: str) -> str:
+        return ADVANCED_UPSTREAM if path.startswith("/api/") else EXCHANGE_UPSTREAM
+
+    def record(self, method: str, path: str, query: str, headers: Dict[str, str], body: bytes):
+        url = self._upstream(path) + path + (f"?{query}" if query else "")
+        forward = {key: value for key, value in headers.items() if key in FORWARD_HEADERS}
+        response = requests.request(method, url, headers=forward, data=body or None)
+        strict_key = requestKey(method, path, query)
+        loose_key = requestKey(method, path, query, strict=False)
+        self.cassette.add(strict_key, response.status_code, response.text)
+        # Also stored without time windows so replays made at a later time still match
+        if loose_key != strict_key:
+            self.cassette.add(loose_key, response.status_code, response.text)
+        return response.status_code, response.text
+
+    def replay(self, method: str, path: str, query: str):
+        with self.cassette.lock:
+            roll = self.random.random()
+            delay = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+        time.sleep(delay / 1000)
+        if roll < self.rate_limit_rate:
+            return 429, json.dumps({"message": "Too Many Requests"}), {"Retry-After": "0.1"}
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, json.dumps({"message": "Injected server error"}), {}
+        recorded = self.cassette.find(method, path, query)
+        if recorded is None:
+            return 404, json.dumps({"message": f"No recording for {method} {path}"}), {}
+        return recorded["status"], recorded["body"], {}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self, method):
+                parsed = urlparse(self.path)
+                if parsed.path == "/__stats":
+                    self._reply(200, json.dumps(dict(server.stats)), {})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                if server.mode == "record":
+                    status_code, text = server.record(method, parsed.path, parsed.query, dict(self.headers), body)
+                    extra_headers = {}
+                else:
+                    status_code, text, extra_headers = server.replay(method, parsed.path, parsed.query)
+                server.stats[status_code] += 1
+                self._reply(status_code, text, extra_headers)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def _reply(self, status_code, text, extra_headers):
+                payload = text.encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in extra_headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        print(f"Replay server ({self.mode}) on http://{self.host}:{self.port}")
+
+    def shutdown(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if self.mode == "record":
+            self.cassette.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay stand-in for the Coinbase REST api")
+    parser.add_argument("--mode", choices=["record", "replay"], default="replay")
+    parser.add_argument("--cassette", default="data/replay/cassette.json")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = ReplayServer(args.cassette, args.mode, port=args.port, latency_ms=args.latency_ms,
+                          jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                          rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import csv
+import json
+import datetime
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import util
+import api_scripts.get_request as api_get
+from api_scripts.rate_limiter import RateLimiter
+
+DEFAULT_START = datetime.datetime(2021, 1, 1, 0, 0)
+CANDLES_PER_REQUEST = 300
+CHECKPOINT_PATH = "data/historical_data/_backfill_checkpoint.json"
+FIELDNAMES = ["timestamp", "low", "high", "open", "close", "volume"]
+# Consecutive empty slices before we assume the pair was not listed yet
+EMPTY_SLICES_TO_STOP = 2
+
+
+class CSVSliceWriter:
+    """
+    Default writer for the per product CSVs. Slices arrive newest first, so they are parked
+    as part files and appended oldest first by flush(), keeping the CSV in time order for
+    util.tailMaxValue. Parts left by an interrupted run are picked up by the next flush.
+    """
+
+    def __init__(self, folder: str = "data/historical_data"):
+        self.folder = folder
+
+    def _partsPath(self, product_id: str) -> str:
+        return os.path.join(self.folder, "_parts", product_id)
+
+    def __call__(self, product_id: str, slice_start: int, candles: List) -> None:
+        parts_path = self._partsPath(product_id)
+        os.makedirs(parts_path, exist_ok=True)
+        # The candles endpoint returns newest first
+        rows = sorted(candles, key=lambda candle: candle[0])
+        with open(os.path.join(parts_path, f"{slice_start}.csv"), "w", newline="") as f:
+            csv.writer(f).writerows(rows)
+
+    def flush(self, product_id: str) -> None:
+        parts_path = self._partsPath(product_id)
+        if not os.path.isdir(parts_path):
+            return
+        part_files = sorted((name for name in os.listdir(parts_path) if name.endswith(".csv")),
+                            key=lambda name: int(name[:-4]))
+        for name in part_files:
+            part_file = os.path.join(parts_path, name)
+            with open(part_file, newline="") as f:
+                rows = list(csv.reader(f))
+            util.saveHistoricalDataCSV({int(name[:-4]): rows}, FIELDNAMES,
+                                       filename=os.path.join(self.folder, f"{product_id}.csv"))
+            os.remove(part_file)
+        os.rmdir(parts_path)
+        if not os.listdir(os.path.dirname(parts_path)):
+            os.rmdir(os.path.dirname(parts_path))
+
+
+def csvWriter(folder="data/historical_data"):
+    return CSVSliceWriter(folder)
+
+
+class BackfillScheduler:
+    """
+    Spreads (product, slice) candle requests over a rate limited worker pool.
+
+    Slices are aligned to a fixed grid so finished slices can be checkpointed and
+    skipped when an interrupted run is restarted. Every product is walked from the
+    newest slice back, once EMPTY_SLICES_TO_STOP adjacent slices are empty the older
+    ones are skipped and the listing date is remembered for the next runs.
+    Products whose history finished once only fetch from latest_ts onwards.
+    """
+
+    def __init__(self, granularity: int = 3600, max_workers: int = 8, rate_per_sec: float = 8.0,
+                 checkpoint_path: str = CHECKPOINT_PATH, writer: Optional[Callable] = None,
+                 start_date: datetime.datetime = DEFAULT_START):
+        self.granularity = granularity
+        self.slice_seconds = granularity * CANDLES_PER_REQUEST
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(rate_per_sec, burst=int(rate_per_sec))
+        self.checkpoint_path = checkpoint_path
+        self.writer = writer or csvWriter()
+        self.start_date = start_date
+        self.checkpoint = self._loadCheckpoint()
+        self.lock = threading.Lock()
+        self.write_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self.empty_slices: Dict[str, set] = defaultdict(set)
+        # Newest slice start of the newest run of empty slices, older slices are skipped
+        self.listing_top: Dict[str, int] = {}
+        self.failed: Dict[str, int] = defaultdict(int)
+
+    def _loadCheckpoint(self) -> Dict:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def _saveCheckpoint(self) -> None:
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _productState(self, product_id: str) -> Dict:
+        state = self.checkpoint.setdefault(product_id, {"done": [], "listed_after": None, "complete": False})
+        state.setdefault("empty", [])
+        return state
+
+    def plan(self, product_id: str, latest_ts: Optional[datetime.datetime] = None,
+             end_date: Optional[datetime.datetime] = None) -> List[int]:
+        """Grid aligned slice start epochs, newest first, without checkpointed ones"""
+        state = self._productState(product_id)
+        end_epoch = int((end_date or datetime.datetime.now()).timestamp())
+        if state["complete"] and latest_ts is not None:
+            start_epoch = int(latest_ts.timestamp())
+        else:
+            start_epoch = int(self.start_date.timestamp())
+            if state["listed_after"]:
+                start_epoch = max(start_epoch, state["listed_after"])
+        first = start_epoch - start_epoch % self.slice_seconds
+        done = set(state["done"])
+        # Empty slices of an interrupted run still count towards a run of empties
+        with self.lock:
+            for slice_start in state["empty"]:
+                self._markEmpty(product_id, slice_start)
+        slices = [epoch for epoch in range(first, end_epoch, self.slice_seconds) if epoch not in done]
+        return slices[::-1]
+
+    def _skip(self, product_id: str, slice_start: int) -> bool:
+        """Older than the newest run of EMPTY_SLICES_TO_STOP empty slices"""
+        with self.lock:
+            top = self.listing_top.get(product_id)
+            return top is not None and slice_start < top - (EMPTY_SLICES_TO_STOP - 1) * self.slice_seconds
+
+    def _markEmpty(self, product_id: str, slice_start: int) -> None:
+        """Adjacency is by slice epochs, checkpointed slices leave holes in the plan positions"""
+        empty = self.empty_slices[product_id]
+        empty.add(slice_start)
+        for top in range(slice_start, slice_start + EMPTY_SLICES_TO_STOP * self.slice_seconds, self.slice_seconds):
+            if all(top - i * self.slice_seconds in empty for i in range(EMPTY_SLICES_TO_STOP)):
+                self.listing_top[product_id] = max(self.listing_top.get(product_id, top), top)
+
+    def _fetch(self, product_id: str, slice_start: int) -> None:
+        if self._skip(product_id, slice_start):
+            return
+        slice_end = slice_start + self.slice_seconds
+        now_epoch = int(datetime.datetime.now().timestamp())
+        self.rate_limiter.acquire()
+        candles = api_get.getCandles(product_id,
+                                     datetime.datetime.utcfromtimestamp(slice_start).isoformat(),
+                                     datetime.datetime.utcfromtimestamp(min(slice_end, now_epoch)).isoformat(),
+                                     self.granularity)
+        if candles is None:
+            with self.lock:
+                self.failed[product_id] += 1
+            return
+        if not candles:
+            with self.lock:
+                self._markEmpty(product_id, slice_start)
+                if slice_end <= now_epoch:
+                    self._productState(product_id)["empty"].append(slice_start)
+        else:
+            with self.write_locks[product_id]:
+                self.writer(product_id, slice_start, candles)
+        # The newest slice is still filling up and is fetched again next run
+        if slice_end <= now_epoch:
+            with self.lock:
+                self._productState(product_id)["done"].append(slice_start)
+                self._saveCheckpoint()
+
+    def run(self, product_ids: List[str],
+            latest_ts: Optional[Callable[[str], Optional[datetime.datetime]]] = None) -> Dict[str, int]:
+        """Backfills all products, latest_ts(product_id) gives the newest stored candle time"""
+        plans = {product_id: self.plan(product_id, latest_ts(product_id) if latest_ts else None)
+                 for product_id in product_ids}
+        # Interleave products so every pair progresses from its newest slice backwards
+        work = []
+        longest = max((len(slices) for slices in plans.values()), default=0)
+        for position in range(longest):
+            for product_id, slices in plans.items():
+                if position < len(slices):
+                    work.append((product_id, slices[position]))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for future in [executor.submit(self._fetch, *item) for item in work]:
+                future.result()
+
+        summary = {}
+        with self.lock:
+            for product_id, slices in plans.items():
+                state = self._productState(product_id)
+                top = self.listing_top.get(product_id)
+                if top is not None:
+                    # Oldest possibly non empty slice, everything before was not listed yet
+                    state["listed_after"] = max(state["listed_after"] or 0, top + self.slice_seconds)
+                if not self.failed[product_id]:
+                    # History is complete, later runs only fetch new candles
+                    state["complete"] = True
+                    state["done"] = []
+                    state["empty"] = []
+                    flush = getattr(self.writer, "flush", None)
+                    if flush:
+                        # Only complete products, a retried older slice would land after newer rows
+                        flush(product_id)
+                summary[product_id] = len(slices)
+            self._saveCheckpoint()
+        return summary
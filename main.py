@@ -9,7 +9,7 @@ def getIds():
     return ids_list
 
 def getTickInfo(ids_list):
-    base_url = 'https://api.exchange.coinbase.com/products/{}/{}'
+    base_url = get_prd.PRODUCTS_URL
     ticker_info = get_prd.getAPIData(base_url, ids_list, "ticker")
     return ticker_info
 
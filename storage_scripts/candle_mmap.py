@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from storage_scripts.candle_store import CandleStore, TimeLike, toEpoch, READ_RETRIES
+
+try:
+    import fcntl
+except ImportError:  # Windows, builds are then only serialised within a process
+    fcntl = None
+
+MMAP_DIR = "_mmap"
+BUILT_FILE = "built.json"
+# Column order of the fixed stride OHLCV array
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(OHLCV_COLUMNS))
+
+
+def mmapPath(store: CandleStore, product_id: str) -> str:
+    return os.path.join(store.productPath(product_id), MMAP_DIR)
+
+
+@contextmanager
+def buildLock(folder: str):
+    """Exclusive lock on folder/build.lock across processes"""
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "build.lock"), "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def storeFingerprint(store: CandleStore, product_id: str) -> str:
+    """
+    Hash of name, size and mtime of every month and delta file, any append, correction
+    or compaction changes it, even when the row count and max_ts stay the same.
+    """
+    digest = hashlib.sha1()
+    for month, partition in sorted(store._partitions(product_id).items()):
+        for path in ([partition["base"]] if partition["base"] else []) + partition["deltas"]:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def readBuilt(folder: str) -> Optional[Dict]:
+    built_path = os.path.join(folder, BUILT_FILE)
+    if not os.path.exists(built_path):
+        return None
+    with open(built_path) as f:
+        return json.load(f)
+
+
+def buildMmap(store: CandleStore, product_id: str, force: bool = True) -> Dict:
+    """
+    Writes ts.npy (int64) and ohlcv.npy (n x 5 float64) of a product into a new version
+    folder and then points built.json at it with an atomic replace, so readers always map
+    two files of the same build. Builds are serialised by a file lock, force=False skips
+    the build when another process already built the current store content.
+    Readers that still map an older version keep a valid view.
+    """
+    folder = mmapPath(store, product_id)
+    with buildLock(folder):
+        store.compact(product_id)
+        fingerprint = storeFingerprint(store, product_id)
+        built = readBuilt(folder)
+        if not force and built and built.get("fingerprint") == fingerprint and built.get("version"):
+            return built
+
+        candles = store.read(product_id)
+        ohlcv = np.empty((candles.size, len(OHLCV_COLUMNS)), dtype=np.float64)
+        for i, column in enumerate(OHLCV_COLUMNS):
+            ohlcv[:, i] = candles[column]
+        version = f"v-{time.time_ns()}-{os.getpid()}"
+        os.makedirs(os.path.join(folder, version))
+        for name, array in (("ts", candles["timestamp"]), ("ohlcv", ohlcv)):
+            np.save(os.path.join(folder, version, f"{name}.npy"), np.ascontiguousarray(array))
+
+        meta = store.metadata(product_id) or {}
+        built = {"version": version, "rows": int(candles.size), "max_ts": meta.get("max_ts"),
+                 "fingerprint": fingerprint}
+        tmp_path = os.path.join(folder, f"{BUILT_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(built, f)
+        os.replace(tmp_path, os.path.join(folder, BUILT_FILE))
+
+        # Older versions and the unversioned files of earlier builds
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if name.startswith("v-") and name != version:
+                shutil.rmtree(path, ignore_errors=True)
+            elif name in ("ts.npy", "ohlcv.npy"):
+                os.remove(path)
+    return built
+
+
+class CandleArrays:
+    """
+    Read-only memory mapped candles of one product.
+
+    ts is the sorted int64 timestamp array and ohlcv the float64 array with one
+    (open, high, low, close, volume) row per timestamp. Both map the files with
+    np.load(mmap_mode="r"), so parallel jobs share the OS page cache instead of each
+    loading a copy, and windows are views that copy nothing.
+
+    Opening only maps the last build, arrays older than the store are served with a
+    warning. Builds are an explicit step (buildMmap, buildMany or running this module),
+    rebuild=True makes this reader build a stale product itself.
+    """
+
+    def __init__(self, product_id: str, store: Optional[CandleStore] = None, rebuild: bool = False):
+        self.product_id = product_id
+        self.store = store or CandleStore()
+        folder = mmapPath(self.store, product_id)
+        if self.isStale():
+            if rebuild:
+                buildMmap(self.store, product_id, force=False)
+            elif readBuilt(folder):
+                print(f"Memory mapped candles of {product_id} are older than the store, run buildMmap")
+        for attempt in range(READ_RETRIES):
+            built = readBuilt(folder)
+            if built is None or not built.get("version"):
+                raise FileNotFoundError(f"No memory mapped candles for {product_id}, build them first")
+            version_path = os.path.join(folder, built["version"])
+            try:
+                self.ts = np.load(os.path.join(version_path, "ts.npy"), mmap_mode="r")
+                self.ohlcv = np.load(os.path.join(version_path, "ohlcv.npy"), mmap_mode="r")
+                break
+            except FileNotFoundError:
+                # A newer build replaced this version after built.json was read
+                if attempt == READ_RETRIES - 1:
+                    raise
+        self.built = built
+
+    def isStale(self) -> bool:
+        """True if the store content changed since the arrays were built"""
+        built = readBuilt(mmapPath(self.store, self.product_id))
+        if not built or not built.get("version"):
+            return True
+        return built.get("fingerprint") != storeFingerprint(self.store, self.product_id)
+
+    def __len__(self) -> int:
+        return self.ts.shape[0]
+
+    def index(self, timestamp: TimeLike, side: str = "left") -> int:
+        """Row of the first candle at or after timestamp (side="right": after), O(log n)"""
+        return int(np.searchsorted(self.ts, toEpoch(timestamp), side=side))
+
+    def asof(self, timestamp: TimeLike) -> int:
+        """Row of the last candle at or before timestamp, -1 if there is none"""
+        return self.index(timestamp, side="right") - 1
+
+    def bounds(self, start: TimeLike = None, end: TimeLike = None) -> Tuple[int, int]:
+        lo = 0 if start is None else self.index(start)
+        hi = len(self) if end is None else self.index(end)
+        return lo, hi
+
+    def window(self, start: TimeLike = None, end: TimeLike = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(ts, ohlcv) views of start <= ts < end"""
+        lo, hi = self.bounds(start, end)
+        return self.ts[lo:hi], self.ohlcv[lo:hi]
+
+    def column(self, column: int, start: TimeLike = None, end: TimeLike = None) -> np.ndarray:
+        """Strided view of one OHLCV column, e.g. column(CLOSE, "2024-01-01", "2024-02-01")"""
+        lo, hi = self.bounds(start, end)
+        return self.ohlcv[lo:hi, column]
+
+
+def openMany(product_ids: Iterable[str], store: Optional[CandleStore] = None,
+             rebuild: bool = False) -> Dict[str, CandleArrays]:
+    store = store or CandleStore()
+    return {product_id: CandleArrays(product_id, store, rebuild) for product_id in product_ids}
+
+
+def buildMany(product_ids: Optional[Iterable[str]] = None, store: Optional[CandleStore] = None) -> Dict[str, Dict]:
+    """Builds the arrays of every product whose store content changed, run before starting readers"""
+    store = store or CandleStore()
+    product_ids = list(product_ids) if product_ids is not None else store.products()
+    return {product_id: buildMmap(store, product_id, force=False) for product_id in product_ids}
+
+
+if __name__ == "__main__":
+    for product_id, built in buildMany().items():
+        print(f"{product_id}: {built['rows']} rows in {built['version']}")
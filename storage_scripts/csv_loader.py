@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Union
+import numpy as np
+import pandas as pd
+from storage_scripts.candle_store import TimeLike, toEpoch
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # pandas parser fallback
+    pa = None
+
+CSV_COLUMNS = ["timestamp", "low", "high", "open", "close", "volume"]
+BLOCK_SIZE = 1 << 20
+
+
+def _readArrow(file_path: str, columns: List[str], start_ts: Optional[int], end_ts: Optional[int]) -> pd.DataFrame:
+    read_columns = columns if "timestamp" in columns else ["timestamp"] + columns
+    convert_options = pa_csv.ConvertOptions(include_columns=read_columns,
+                                            column_types={"timestamp": pa.int64()})
+    reader = pa_csv.open_csv(file_path, read_options=pa_csv.ReadOptions(block_size=BLOCK_SIZE),
+                             convert_options=convert_options)
+    batches = []
+    # Filter each block while streaming, rows outside the range never reach pandas
+    for batch in reader:
+        mask = None
+        if start_ts is not None:
+            mask = pc.greater_equal(batch["timestamp"], start_ts)
+        if end_ts is not None:
+            end_mask = pc.less(batch["timestamp"], end_ts)
+            mask = end_mask if mask is None else pc.and_(mask, end_mask)
+        batches.append(batch if mask is None else batch.filter(mask))
+    table = pa.Table.from_batches(batches, schema=reader.schema)
+    return table.to_pandas()
+
+
+def _readPandas(file_path: str, columns: List[str], start_ts: Optional[int], end_ts: Optional[int]) -> pd.DataFrame:
+    read_columns = columns if "timestamp" in columns else ["timestamp"] + columns
+    df = pd.read_csv(file_path, usecols=read_columns)
+    mask = np.ones(len(df), dtype=bool)
+    if start_ts is not None:
+        mask &= df["timestamp"].to_numpy() >= start_ts
+    if end_ts is not None:
+        mask &= df["timestamp"].to_numpy() < end_ts
+    return df[mask]
+
+
+def loadCandleCSV(file_path: str, columns: Optional[List[str]] = None, start: TimeLike = None,
+                  end: TimeLike = None) -> pd.DataFrame:
+    """
+    One historical CSV with only the wanted columns and start <= timestamp < end,
+    indexed by date, sorted and without duplicate timestamps (first one kept).
+    """
+    columns = list(columns or CSV_COLUMNS)
+    start_ts, end_ts = toEpoch(start), toEpoch(end)
+    try:
+        read = _readArrow if pa is not None else _readPandas
+        df = read(file_path, columns, start_ts, end_ts)
+    except Exception as e:
+        print(f"Failed to read {file_path}: {e}")
+        return pd.DataFrame(columns=columns)
+    timestamps = df["timestamp"].to_numpy()
+    # Slices are appended out of order and may overlap, sort on the int column once
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = timestamps[order]
+    keep = np.ones(timestamps.size, dtype=bool)
+    keep[1:] = timestamps[1:] != timestamps[:-1]
+    df = df.iloc[order[keep]]
+    df.index = pd.to_datetime(timestamps[keep], unit="s")
+    df.index.name = "date"
+    return df[columns]
+
+
+def loadCSVDir(folder_path: str = "data/historical_data", columns: Optional[List[str]] = None,
+               start: TimeLike = None, end: TimeLike = None, long: bool = False,
+               max_workers: Optional[int] = None) -> Union[Dict[str, pd.DataFrame], pd.DataFrame]:
+    """
+    Loads every CSV of a folder in a process pool, one file per task.
+    Returns {file_name: df} like analyze_data.readCSV, or with long=True one frame
+    with a categorical pair column.
+    """
+    file_names = sorted(name for name in os.listdir(folder_path) if name.endswith(".csv"))
+    file_paths = [os.path.join(folder_path, name) for name in file_names]
+    count = len(file_paths)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        dfs = list(executor.map(loadCandleCSV, file_paths, [columns] * count, [start] * count, [end] * count,
+                                chunksize=max(1, count // (4 * (max_workers or os.cpu_count() or 1)))))
+    all_dfs = {name: df for name, df in zip(file_names, dfs) if not df.empty}
+    if not long:
+        return all_dfs
+    if not all_dfs:
+        return pd.DataFrame()
+    pairs = [name[:-len(".csv")] for name in all_dfs]
+    long_df = pd.concat(all_dfs.values())
+    long_df.insert(0, "pair", pd.Categorical.from_codes(
+        np.repeat(np.arange(len(pairs)), [len(df) for df in all_dfs.values()]), categories=pairs))
+    return long_df
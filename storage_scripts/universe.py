@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from sortedcontainers import SortedDict, SortedList
+import util
+import api_scripts.get_request as api_get
+from storage_scripts.candle_store import CandleStore
+
+UNIVERSE_PATH = "data/universe.json"
+LEGACY_PICKLE = "data/coin_pairs_vol_100m_30days.pkl"
+WINDOW_DAYS = 30
+MIN_VOLUME = 100_000_000  # USD over the window, the threshold of the legacy pickle
+DAY = 86400
+# Pairs whose stored candles are older than this are ranked on the exchange snapshot instead
+STALE_AFTER = 2 * DAY
+STABLE_COINS = {"USDT", "USDC", "DAI", "TUSD", "EUR", "GBP", "BUSD"}
+
+
+class Universe:
+    """
+    Rolling WINDOW_DAYS USD volume (volume * close per hourly candle) of every pair.
+
+    Daily USD volumes are kept per pair and persisted, refresh only reads the stored
+    candles from the last seen day on, so an update costs the new hours instead of the
+    whole window. Pairs are kept ranked in a SortedList, volume lookups are a dict
+    read and top-N or threshold queries a bisect plus the returned slice.
+
+    Candidates come from the exchange too: seed() takes one bulk /products/stats snapshot,
+    pairs without fresh stored candles (new listings, pairs that dropped out of the backfill)
+    are ranked on its 30 day volume, so they can enter the selection and get backfilled.
+    addTrade is the market_trades listener of websocket_scripts/run_websocket_orderbook_v2.
+    """
+
+    def __init__(self, store: Optional[CandleStore] = None, path: str = UNIVERSE_PATH,
+                 window_days: int = WINDOW_DAYS):
+        self.store = store or CandleStore()
+        self.path = path
+        self.window_days = window_days
+        self.daily: Dict[str, SortedDict] = {}
+        self.last_ts: Dict[str, int] = {}
+        # 30 day USD volume of the last exchange stats snapshot
+        self.snapshot: Dict[str, float] = {}
+        self.volumes: Dict[str, float] = {}
+        # Highest volume first, ties by pair name
+        self.ranking = SortedList()
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            state = json.load(f)
+        for product_id, pair_state in state.items():
+            self.daily[product_id] = SortedDict({int(day): volume for day, volume in pair_state["daily"].items()})
+            if pair_state.get("last_ts") is not None:
+                self.last_ts[product_id] = pair_state["last_ts"]
+            if pair_state.get("snapshot") is not None:
+                self.snapshot[product_id] = pair_state["snapshot"]
+            self._rerank(product_id)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock:
+            state = {product_id: {"last_ts": self.last_ts.get(product_id), "snapshot": self.snapshot.get(product_id),
+                                  "daily": dict(self.daily.get(product_id, {}))}
+                     for product_id in set(self.daily) | set(self.snapshot)}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _windowStart(self, now: Optional[float] = None) -> int:
+        today = int(now if now is not None else time.time()) // DAY * DAY
+        return today - (self.window_days - 1) * DAY
+
+    def _rerank(self, product_id: str, now: Optional[float] = None) -> None:
+        """Drops days that left the window and moves the pair to its new rank"""
+        daily = self.daily.setdefault(product_id, SortedDict())
+        window_start = self._windowStart(now)
+        while daily and daily.peekitem(0)[0] < window_start:
+            daily.popitem(0)
+        old_volume = self.volumes.get(product_id)
+        if old_volume is not None:
+            self.ranking.remove((-old_volume, product_id))
+        volume = float(sum(daily.values()))
+        now = now if now is not None else time.time()
+        if product_id in self.snapshot and self.last_ts.get(product_id, 0) < now - STALE_AFTER:
+            # Live trades still count when they already add up to more than the snapshot
+            volume = max(volume, self.snapshot[product_id])
+        self.volumes[product_id] = volume
+        self.ranking.add((-volume, product_id))
+
+    def update(self, product_id: str, candles: np.ndarray, now: Optional[float] = None) -> None:
+        """
+        Sets the daily USD volumes of the days covered by candles (sorted hourly store rows),
+        the first day has to be complete in candles because it replaces the stored value.
+        """
+        with self.lock:
+            daily = self.daily.setdefault(product_id, SortedDict())
+            if candles.size:
+                days = candles["timestamp"] // DAY * DAY
+                starts = np.flatnonzero(np.diff(days, prepend=days[0] - 1))
+                usd_volumes = np.add.reduceat(candles["volume"] * candles["close"], starts)
+                daily.update(zip(days[starts].tolist(), usd_volumes.tolist()))
+                self.last_ts[product_id] = int(candles["timestamp"][-1])
+            self._rerank(product_id, now)
+
+    def addTrade(self, product_id: str, ts: float, price: float, size: float) -> None:
+        """Live trade, counted until the next refresh replaces its day with the stored candles"""
+        with self.lock:
+            daily = self.daily.setdefault(product_id, SortedDict())
+            day = int(ts) // DAY * DAY
+            daily[day] = daily.get(day, 0.0) + price * size
+            self._rerank(product_id, ts)
+
+    def seed(self, stats: Optional[Dict] = None) -> bool:
+        """30 day USD volume (base volume * last price) of every pair from one stats snapshot"""
+        stats = stats if stats is not None else api_get.getProductStats()
+        if not stats:
+            return False
+        snapshot = {}
+        for product_id, product_stats in stats.items():
+            try:
+                volume = float(product_stats["stats_30day"]["volume"]) * float(product_stats["stats_24hour"]["last"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if volume > 0:
+                snapshot[product_id] = volume
+        with self.lock:
+            # Pairs missing from the new snapshot fall back to their stored volume
+            changed = set(self.snapshot) | set(snapshot)
+            self.snapshot = snapshot
+            for product_id in changed:
+                self._rerank(product_id)
+        return True
+
+    def refresh(self, product_ids: Optional[Iterable[str]] = None, save: bool = True, seed: bool = True) -> None:
+        """
+        Reads the candles that arrived since the last refresh, from the start of their day,
+        seed=True also takes a new exchange snapshot for pairs the store does not cover.
+        """
+        if seed:
+            self.seed()
+        product_ids = list(product_ids) if product_ids is not None else self.store.products()
+        window_start = self._windowStart()
+        starts = {product_id: max(window_start, self.last_ts.get(product_id, 0) // DAY * DAY)
+                  for product_id in product_ids}
+        # Grouped by start so pairs refreshed together share one readMany
+        for start in set(starts.values()):
+            group = [product_id for product_id, pair_start in starts.items() if pair_start == start]
+            for product_id, candles in self.store.readMany(group, start).items():
+                self.update(product_id, candles)
+        with self.lock:
+            # Pairs without new candles still age out of the window
+            for product_id in (set(self.daily) | set(self.snapshot)) - set(product_ids):
+                self._rerank(product_id)
+        if save:
+            self.save()
+
+    def volume(self, product_id: str) -> float:
+        return self.volumes.get(product_id, 0.0)
+
+    def top(self, n: int, among: Optional[Iterable[str]] = None) -> List[str]:
+        """The n pairs with the highest volume, optionally only from among"""
+        if among is None:
+            return [product_id for _, product_id in self.ranking[:n]]
+        among = set(among)
+        result = []
+        for _, product_id in self.ranking:
+            if len(result) == n:
+                break
+            if product_id in among:
+                result.append(product_id)
+        return result
+
+    def above(self, min_volume: float = MIN_VOLUME) -> List[str]:
+        """Pairs with at least min_volume USD over the window, highest first"""
+        index = self.ranking.bisect_right((-min_volume, chr(0x10FFFF)))
+        return [product_id for _, product_id in self.ranking[:index]]
+
+    def pairs(self, min_volume: float = MIN_VOLUME, quote: Optional[str] = None,
+              exclude_bases: Iterable[str] = ()) -> List[str]:
+        """above() filtered on the quote currency (suffix match like "USD") and base currencies"""
+        exclude_bases = set(exclude_bases)
+        result = []
+        for product_id in self.above(min_volume):
+            base, second = product_id.split("-", 1)
+            if base not in exclude_bases and (quote is None or second.endswith(quote)):
+                result.append(product_id)
+        return result
+
+
+def getUniverse(min_volume: float = MIN_VOLUME, quote: Optional[str] = None, exclude_bases: Iterable[str] = (),
+                store: Optional[CandleStore] = None, path: str = UNIVERSE_PATH,
+                legacy_path: str = LEGACY_PICKLE, refresh: bool = True) -> List[str]:
+    """
+    Pairs above min_volume ranked from the candle store and the exchange stats snapshot,
+    the legacy pickle is only read when neither has any pairs.
+    """
+    universe = Universe(store, path)
+    if refresh:
+        universe.refresh()
+    pairs = universe.pairs(min_volume, quote, exclude_bases)
+    if pairs or not os.path.exists(legacy_path):
+        return pairs
+    exclude_bases = set(exclude_bases)
+    return [pair for pair in util.readPickle(legacy_path)
+            if pair.split("-")[0] not in exclude_bases and (quote is None or pair.split("-")[1].endswith(quote))]
+
+
+if __name__ == "__main__":
+    universe = Universe()
+    universe.refresh()
+    selected = universe.above()
+    for rank, product_id in enumerate(universe.top(20), start=1):
+        print(f"{rank:>3} {product_id:<12} {universe.volume(product_id):,.0f} USD")
+    # Scripts that still read the pickle get the fresh selection
+    util.savePickle(LEGACY_PICKLE, selected)
+    print(f"{len(selected)} pairs above {MIN_VOLUME:,} USD written to {LEGACY_PICKLE}")
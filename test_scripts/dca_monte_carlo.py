@@ -0,0 +1,88 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+from storage_scripts.candle_store import CandleStore
+from test_scripts.dca_sweep import fixedDCA, flexibleDCA
+from test_scripts.test_dca_strat import MONTHLY_BUDGET, NUM_BUYS, BUY_WINDOW_DAYS, TARGET_DIP_PERCENT
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def blockBootstrapPaths(log_returns: np.ndarray, n_paths: int, length: int, block_size: int,
+                        rng: np.random.Generator, start_price: float = 1.0) -> np.ndarray:
+    """
+    (n_paths, length) price paths glued from random blocks of consecutive historical
+    returns, blocks keep the short term autocorrelation and volatility clusters.
+    """
+    n_blocks = -(-length // block_size)
+    block_starts = rng.integers(0, log_returns.size - block_size + 1, size=(n_paths, n_blocks))
+    idx = (block_starts[:, :, None] + np.arange(block_size)).reshape(n_paths, -1)[:, :length]
+    paths = np.cumsum(log_returns[idx], axis=1)
+    # First price of every path is start_price
+    paths -= paths[:, :1]
+    return start_price * np.exp(paths)
+
+
+def simulatePaths(paths: np.ndarray, num_buys: int = NUM_BUYS, buy_window_days: int = BUY_WINDOW_DAYS,
+                  target_dip: float = TARGET_DIP_PERCENT, monthly_budget: float = MONTHLY_BUDGET,
+                  rows_per_day: int = 24) -> Dict[str, np.ndarray]:
+    """Fixed and flexible DCA on every path at once"""
+    fixed_avg = fixedDCA(paths, rows_per_day)
+    fixed_buys = -(-paths.shape[1] // (30 * rows_per_day))
+    base_per_usd, buy_count = flexibleDCA(paths, num_buys, buy_window_days, np.float64(target_dip), rows_per_day)
+    return {
+        "fixed_avg_price": fixed_avg,
+        "fixed_base": fixed_buys * monthly_budget / fixed_avg,
+        "flexible_avg_price": (buy_count / num_buys) / base_per_usd,
+        "flexible_base": monthly_budget * base_per_usd,
+    }
+
+
+def _simulateChunk(task) -> Dict[str, np.ndarray]:
+    log_returns, n_paths, length, block_size, start_price, seed_seq, params = task
+    rng = np.random.default_rng(seed_seq)
+    paths = blockBootstrapPaths(log_returns, n_paths, length, block_size, rng, start_price)
+    return simulatePaths(paths, **params)
+
+
+def summarize(results: Dict[str, np.ndarray]) -> pd.DataFrame:
+    rows = {}
+    for name, values in results.items():
+        row = {"mean": values.mean(), "std": values.std()}
+        row.update({f"p{q}": value for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))})
+        rows[name] = row
+    return pd.DataFrame(rows).T
+
+
+def runMonteCarlo(product_id: str = "BTC-USD", n_paths: int = 10000, days: int = 365, block_days: int = 7,
+                  seed: int = 42, start=None, end=None, max_workers: Optional[int] = 1,
+                  chunk_size: int = 1000, store: Optional[CandleStore] = None, **params):
+    """
+    Block bootstrap of the stored hourly returns of product_id, returns (summary, results).
+    Each chunk of paths gets its own child of SeedSequence(seed), so results only depend on
+    the seed and chunk_size, not on the number of workers. max_workers=None uses all cores.
+    """
+    store = store or CandleStore()
+    closes = store.read(product_id, start, end)["close"]
+    if closes.size < 2:
+        raise ValueError(f"No stored candles for {product_id}")
+    log_returns = np.diff(np.log(closes))
+    length, block_size = days * 24, block_days * 24
+    chunks = [min(chunk_size, n_paths - i) for i in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(log_returns, chunk, length, block_size, float(closes[-1]), seed_seq, params)
+             for chunk, seed_seq in zip(chunks, seeds)]
+    if max_workers == 1:
+        outputs = [_simulateChunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outputs = list(executor.map(_simulateChunk, tasks))
+    results = {name: np.concatenate([output[name] for output in outputs]) for name in outputs[0]}
+    results["flexible_cheaper"] = (results["flexible_avg_price"] < results["fixed_avg_price"]).astype(np.float64)
+    return summarize(results), results
+
+
+if __name__ == "__main__":
+    summary, _ = runMonteCarlo("BTC-USD", n_paths=10000, max_workers=None)
+    print(summary.to_string())
@@ -0,0 +1,117 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from storage_scripts.candle_store import CandleStore
+from test_scripts.test_dca_strat import MONTHLY_BUDGET, NUM_BUYS, BUY_WINDOW_DAYS, TARGET_DIP_PERCENT
+
+DAYS_PER_MONTH = 30
+
+
+def windowStats(prices: np.ndarray, starts: np.ndarray, window: int):
+    """
+    Minimum and last price of prices[..., i:i + window + 1] for every start i along the last
+    axis, windows running past the end are cut off there like in flexible_dca. Full windows
+    use a strided view. prices may hold one series or a batch of paths.
+    """
+    n = prices.shape[-1]
+    suffix_min = np.flip(np.minimum.accumulate(np.flip(prices, axis=-1), axis=-1), axis=-1)
+    window_min = suffix_min[..., starts].copy()
+    window_last = np.repeat(prices[..., -1:], starts.size, axis=-1)
+    full = starts + window < n
+    if full.any() and window + 1 <= n:
+        views = sliding_window_view(prices, window + 1, axis=-1)
+        window_min[..., full] = views[..., starts[full], :].min(axis=-1)
+        window_last[..., full] = prices[..., starts[full] + window]
+    return window_min, window_last
+
+
+def fixedDCA(prices: np.ndarray, rows_per_day: int = 24):
+    """Average price of equal buys every DAYS_PER_MONTH days, same as fixed_dca"""
+    buys = prices[..., ::DAYS_PER_MONTH * rows_per_day]
+    return buys.shape[-1] / np.sum(1.0 / buys, axis=-1)
+
+
+def flexibleDCA(prices: np.ndarray, num_buys: int, buy_window_days: int, target_dips: np.ndarray,
+                rows_per_day: int = 24):
+    """
+    flexible_dca for many dip targets (or many price paths) at once, returns
+    (base bought per 1 USD budget, buys). The buys depend on the previous buy price so
+    the loop runs over buy dates, each step is one vectorised comparison.
+    """
+    step = DAYS_PER_MONTH * rows_per_day // num_buys
+    starts = np.arange(0, prices.shape[-1], step)
+    window_min, window_last = windowStats(prices, starts, buy_window_days * rows_per_day)
+    shape = np.broadcast_shapes(prices.shape[:-1], np.shape(target_dips))
+    last_buy = np.broadcast_to(prices[..., 0], shape).astype(np.float64)
+    base_per_usd = np.zeros(shape)
+    for i in range(starts.size):
+        dipped = window_min[..., i] <= last_buy * (1 - target_dips)
+        last_buy = np.where(dipped, window_min[..., i], window_last[..., i])
+        base_per_usd += 1.0 / (num_buys * last_buy)
+    return base_per_usd, starts.size
+
+
+def sweepPrices(prices: np.ndarray, num_buys: Iterable[int], buy_window_days: Iterable[int],
+                target_dips: Iterable[float], monthly_budgets: Iterable[float] = (MONTHLY_BUDGET,),
+                rows_per_day: int = 24) -> pd.DataFrame:
+    """All parameter combinations on one price series as a tidy frame"""
+    target_dips = np.asarray(list(target_dips), dtype=np.float64)
+    monthly_budgets = np.asarray(list(monthly_budgets), dtype=np.float64)
+    fixed_avg_price = fixedDCA(prices, rows_per_day)
+    frames = []
+    for buys, window_days in itertools.product(num_buys, buy_window_days):
+        base_per_usd, buy_count = flexibleDCA(prices, buys, window_days, target_dips, rows_per_day)
+        # Every buy spends budget / buys, so totals scale linearly with the budget
+        usd_per_budget = buy_count / buys
+        dips, budgets = np.meshgrid(target_dips, monthly_budgets, indexing="ij")
+        frames.append(pd.DataFrame({
+            "num_buys": buys,
+            "buy_window_days": window_days,
+            "target_dip_percent": dips.ravel(),
+            "monthly_budget": budgets.ravel(),
+            "total_usd": (usd_per_budget * budgets).ravel(),
+            "total_base": (base_per_usd[:, None] * budgets).ravel(),
+            "avg_price": np.repeat(usd_per_budget / base_per_usd, monthly_budgets.size),
+        }))
+    result = pd.concat(frames, ignore_index=True)
+    result["fixed_avg_price"] = fixed_avg_price
+    result["improvement_pct"] = (1 - result["avg_price"] / fixed_avg_price) * 100
+    return result
+
+
+def _sweepTask(task) -> Optional[pd.DataFrame]:
+    product_id, year, params, store_root = task
+    store = CandleStore(store_root)
+    candles = store.read(product_id, f"{year}-01-01", f"{year + 1}-01-01")
+    if candles.size < 2:
+        return None
+    rows_per_day = int(round(86400 / np.median(np.diff(candles["timestamp"]))))
+    result = sweepPrices(candles["close"], rows_per_day=rows_per_day, **params)
+    result.insert(0, "year", year)
+    result.insert(0, "pair", product_id)
+    return result
+
+
+def runSweep(product_ids: List[str], years: List[int], num_buys: Iterable[int] = (NUM_BUYS,),
+             buy_window_days: Iterable[int] = (BUY_WINDOW_DAYS,), target_dips: Iterable[float] = (TARGET_DIP_PERCENT,),
+             monthly_budgets: Iterable[float] = (MONTHLY_BUDGET,), store_root: Optional[str] = None,
+             max_workers: Optional[int] = None) -> pd.DataFrame:
+    """Sweeps every (pair, year) in a process pool, candles come from the candle store"""
+    params: Dict = {"num_buys": list(num_buys), "buy_window_days": list(buy_window_days),
+                    "target_dips": list(target_dips), "monthly_budgets": list(monthly_budgets)}
+    store_root = store_root or CandleStore().root
+    tasks = [(product_id, year, params, store_root) for product_id in product_ids for year in years]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = [result for result in executor.map(_sweepTask, tasks) if result is not None]
+    return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+
+if __name__ == "__main__":
+    sweep = runSweep(["BTC-USD", "ETH-USD"], list(range(2021, 2026)),
+                     num_buys=[1, 2, 4], buy_window_days=[7, 14, 30],
+                     target_dips=np.round(np.arange(0.0, 0.2, 0.0025), 4))
+    best = sweep.sort_values("improvement_pct", ascending=False).groupby(["pair", "year"]).head(3)
+    print(best.to_string(index=False))
@@ -9,6 +9,9 @@ BUY_WINDOW_DAYS = 30
 TARGET_DIP_PERCENT = 0.03
 
 def filter_year(btc_data, year):
+    if btc_data.index.name == 'date':
+        # Frames from the candle store are sorted and unique already
+        return btc_data[btc_data.index.year == year]
     btc_data['date'] = pd.to_datetime(btc_data['timestamp'], unit='s')
     filtered_df = btc_data[btc_data['date'].dt.year == year]
     filtered_df.set_index('date', inplace=True)
@@ -1,33 +1,33 @@
+import time
 import api_scripts.get_request as get_req
-import api_scripts.post_requests as post_req
 from decimal import Decimal, ROUND_DOWN
+from trade_scripts.order_engine import OrderEngine, OrderIntent, printAcks
 
 # ==== ROUND BASE SIZE ====
 def round_base_size(value, increment):
     return Decimal(value).quantize(Decimal(increment), rounding=ROUND_DOWN)
 
-def buyOrder(usdc_amount = 1):
+def buyOrder(usdc_amount = 1, engine=None, batch_id=None):
     product_ids = ["BTC-USD", "ETH-USD", "XRP-USD", "SOL-USD",
                    "ADA-USD", "SUI-USD", "HBAR-USD"]
-    prices = get_req.getCurrentBestBidAsk(product_ids)
+    prices = get_req.getCurrentBestBidAsk(product_ids, use_oracle=True)
+    intents = []
     for product_id in product_ids:
-        info = get_req.getProductInfo(product_id)
-        if 'price' not in info:
-            print(f"❌ Failed to fetch product info for {product_id}")
+        if product_id not in prices:
+            print(f"❌ Failed to fetch price for {product_id}")
             continue
+        best_bid_price = prices[product_id]["bids"][0]["price"]
+        # Base size is derived from the usd amount and rounded by the engine
+        intents.append(OrderIntent(product_id, "BUY", best_bid_price, quote_size=usdc_amount))
 
-        best_bid_price = Decimal(prices[product_id]["bids"][0]["price"])
-        base_increment = info['base_increment']
-        min_order_size = Decimal(info['base_min_size'])
+    # All orders go out concurrently, sizes are checked against cached product rules
+    # Every run is a new batch, pass the batch id printed by an interrupted run to resume it
+    # without buying twice
+    batch_id = batch_id or f"buy-orders:{time.time_ns()}"
+    print(f"Batch {batch_id}")
+    acks = (engine or OrderEngine()).submit(intents, batch_id)
+    printAcks(acks)
+    return acks
 
-        # Calculate base size (amount of coin to buy)
-        base_size = Decimal(usdc_amount) / best_bid_price
-        base_size = round_base_size(base_size, base_increment)
-
-        if base_size < min_order_size:
-            print(f"⚠️ Order for {product_id} too small: {base_size} < min {min_order_size}")
-            continue
-
-        post_req.buyLimitOrder(product_id, str(best_bid_price), str(base_size))
-
-buyOrder(usdc_amount = 1)
\ No newline at end of file
+if __name__ == "__main__":
+    buyOrder(usdc_amount = 1)
@@ -1,66 +1,15 @@
 import datetime
-import pandas as pd
 import api_scripts.get_request as api_get
-from collections import defaultdict
-def getBuyFills(fills, sel_date):
-    buy_pair_dict = defaultdict(list)
-
-    for fill in fills:
-        # Parse trade time and filter by date
-        trade_time = fill["trade_time"]
-        date = datetime.datetime.fromisoformat(trade_time[:-1])
-        if date < sel_date:
-            continue
-
-        # Check if the side is "BUY"
-        if fill["side"].upper() != "BUY":
-            continue
-
-        # Extract product ID, price, and quantity
-        prd_id = fill["product_id"]
-        trade_price = float(fill["price"])
-        trade_quantity = float(fill["size"])
-        fee = float(fill.get("commission", 0))
-        buy_pair = (trade_price, trade_quantity, fee)
-
-        # Use setdefault to simplify dictionary updates
-        buy_pair_dict[prd_id].append(buy_pair)
-
-    return buy_pair_dict
-
-# Function to process the coins and calculate the adjusted quantities
-def adjust_coin_quantities(fills):
-    result = {}
-
-    for coin_pair_id, list_fills in fills.items():
-        # Aggregate the fills
-        total_qty = sum(qty for _, qty, _ in list_fills)
-        total_cost = sum((price * qty) + fee for price, qty, fee in list_fills)
-        # Average price among the fills
-        original_avg_price = (
-            total_cost / total_qty
-        )  # Weighted average price for the coin
-
-        result[coin_pair_id] = {
-            "avg_price": original_avg_price,
-            "total_qty": total_qty,
-            "total_cost": total_cost,
-        }
-
-    return result
+from trade_scripts.order_ledger import OrderLedger
 
 sel_date = datetime.datetime(2025, 7, 1, 0, 0)
-end_point_param = "orders/historical/fills"
-orders = api_get.getOrders(end_point_param)
-get_endpoint = f"orders/historical/batch"
-test = api_get.getOrders(get_endpoint)
-
-fills = orders["fills"]
-buy_fills_dict = getBuyFills(fills, sel_date)
-result = adjust_coin_quantities(buy_fills_dict)
+# Local ledger only downloads fills since the previous run
+ledger = OrderLedger()
+ledger.sync()
+result = ledger.averageCost(side="BUY", since=sel_date)
 fee_multiplier = 0.9975 # 0.25% sell fee
 for coin_pair, buy_info in result.items():
-    current_price = api_get.getCurrentPrice(coin_pair)
+    current_price = api_get.getCurrentPrice(coin_pair, use_oracle=True)
     fee_reduced_price = current_price * fee_multiplier
     price_percent_change = (fee_reduced_price / buy_info["avg_price"]) * 100
 
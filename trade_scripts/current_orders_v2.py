@@ -2,13 +2,17 @@ import datetime
 import pandas as pd
 import api_scripts.get_request as api_get
 from collections import defaultdict
+from trade_scripts.order_ledger import OrderLedger
 def getBuyOrders(all_orders, sel_date, sel_status="FILLED",
                  sel_side="BUY",sel_order_type="LIMIT"):
     buy_pair_dict = defaultdict(dict)
 
     for order in all_orders:
         trade_time = order.get('created_time', '')
-        date = datetime.datetime.fromisoformat(trade_time[:-1])
+        if not trade_time:
+            # Tracked orders from the user channel can come without a creation time
+            continue
+        date = datetime.datetime.fromisoformat(trade_time.rstrip("Z"))
         if date < sel_date:
             continue
 
@@ -32,16 +36,21 @@ def getBuyOrders(all_orders, sel_date, sel_status="FILLED",
     return buy_pair_dict
 
 sel_date = datetime.datetime(2025, 7, 1, 0, 0)
-get_endpoint = f"orders/historical/batch"
-orders = api_get.getOrders(get_endpoint)["orders"]
+ledger = OrderLedger()
+ledger.sync()
+buy_orders = ledger.queryOrders(status="FILLED", side="BUY", order_type="LIMIT", since=sel_date)
+# Open orders come from the live user channel index when the tracker runs
+sell_orders = api_get.getTrackedOrders(status="OPEN", side="SELL")
+if sell_orders is None:
+    sell_orders = ledger.queryOrders(status="OPEN", side="SELL", order_type="LIMIT", since=sel_date)
 
-buy_orders_dict = getBuyOrders(orders, sel_date, sel_status="FILLED",
+buy_orders_dict = getBuyOrders(buy_orders, sel_date, sel_status="FILLED",
                                 sel_side="BUY",sel_order_type="LIMIT")
-sold_orders_dict = getBuyOrders(orders, sel_date, sel_status="OPEN",
+sold_orders_dict = getBuyOrders(sell_orders, sel_date, sel_status="OPEN",
                                 sel_side="SELL",sel_order_type="LIMIT")
 fee_multiplier = 0.9975 # 0.25% sell fee
 for coin_pair, buy_info in buy_orders_dict.items():
-    current_price = api_get.getCurrentPrice(coin_pair)
+    current_price = api_get.getCurrentPrice(coin_pair, use_oracle=True)
     fee_reduced_price = current_price * fee_multiplier
     price_percent_change = (fee_reduced_price / buy_info["avg_price"]) * 100
 
@@ -0,0 +1,261 @@
+import time
+import queue
+import logging
+import datetime
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Any
+import api_scripts.post_requests as post_req
+from trade_scripts.order_engine import OrderEngine, OrderIntent, printAcks
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"CANCELLED", "EXPIRED", "FAILED"}
+
+
+@dataclass
+class DCASchedule:
+    """One month of dip-target buys for a pair, same parameters as test_scripts/btc_dca.py"""
+    product_id: str
+    monthly_budget: float = 1000  # USD
+    num_buys: int = 4
+    buy_window_days: int = 2  # days watched around every scheduled buy date
+    target_dip: float = 0.03  # buy once the mid drops this far below the last buy
+    start: Optional[datetime.datetime] = None
+    repeat: bool = True  # start the next month when all buys are done
+
+    def windows(self, start: datetime.datetime) -> List[Tuple[float, float]]:
+        """(start, end) epoch seconds of every buy window, buy dates evenly spread over 30 days"""
+        interval_days = 30 // self.num_buys
+        half_window = datetime.timedelta(days=self.buy_window_days / 2)
+        buy_dates = [start + datetime.timedelta(days=i * interval_days) for i in range(self.num_buys)]
+        return [((date - half_window).timestamp(), (date + half_window).timestamp()) for date in buy_dates]
+
+
+@dataclass
+class DCAState:
+    schedule: DCASchedule
+    windows: List[Tuple[float, float]]
+    window_index: int = 0
+    reference_price: Optional[float] = None
+    order_id: Optional[str] = None
+    client_order_id: Optional[str] = None
+    order_kind: Optional[str] = None  # "dip" or "fallback"
+    order_price: Optional[float] = None
+    # An action for this pair is queued or being sent, listeners do not queue another
+    busy: bool = False
+    # (order_id, client_order_id) of re-priced orders that were cancelled but not confirmed closed yet
+    retired: List[Tuple[Optional[str], Optional[str]]] = field(default_factory=list)
+    bought: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def window(self) -> Optional[Tuple[float, float]]:
+        return self.windows[self.window_index] if self.window_index < len(self.windows) else None
+
+
+class DCAService:
+    """
+    Runs the dip-target DCA of many pairs on live prices instead of polling.
+
+    on_book_update (tracker book listener) compares the mid with the target the moment
+    the book changes and queues a post-only buy, on_order_update (OpenOrderIndex listener)
+    follows the order to its fill. Listeners only queue work, orders are sent from the
+    service thread, which otherwise sleeps until the next window closes. When a window
+    closes without a fill the dip order is replaced by a buy at the best bid that follows
+    the bid up until it fills.
+    """
+
+    def __init__(self, schedules: List[DCASchedule], order_books: Dict[str, Any], engine: Optional[OrderEngine] = None,
+                 post_new_orders: bool = False, reprice_threshold: float = 0.002):
+        self.order_books = order_books
+        self.engine = engine or OrderEngine()
+        self.post_new_orders = post_new_orders
+        self.reprice_threshold = reprice_threshold
+        self.states: Dict[str, DCAState] = {}
+        for schedule in schedules:
+            start = schedule.start or datetime.datetime.now()
+            self.states[schedule.product_id] = DCAState(schedule, schedule.windows(start))
+        # order_id and client_order_id -> product_id, client ids are known before the order is sent
+        self.order_products: Dict[str, str] = {}
+        self.actions: "queue.Queue[Tuple[str, str, Any]]" = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    # ---- listeners, run on the websocket threads ----
+    def on_book_update(self, product_id: str, book) -> None:
+        state = self.states.get(product_id)
+        if state is None or state.busy or state.window is None:
+            return
+        best_bid, best_ask = book.best_bid, book.best_ask
+        if best_bid is None or best_ask is None:
+            return
+        mid = (best_bid + best_ask) / 2
+        if state.reference_price is None:
+            state.reference_price = mid
+            logger.info(f"{product_id} DCA reference price {mid}")
+        window_start, window_end = state.window
+        now = time.time()
+        if state.order_kind is None and window_start <= now < window_end:
+            target = state.reference_price * (1 - state.schedule.target_dip)
+            if mid <= target:
+                self._queue(state, "dip", min(target, best_bid))
+        elif state.order_kind == "fallback" and best_bid > state.order_price * (1 + self.reprice_threshold):
+            self._queue(state, "fallback", best_bid)
+        elif state.order_kind is not None and not self.post_new_orders and best_ask <= state.order_price:
+            # Dry run, the ask trading down to the order counts as its fill
+            state.busy = True
+            self.actions.put(("order", product_id, {"order_id": state.order_id, "status": "FILLED",
+                                                    "average_filled_price": state.order_price}))
+
+    def on_order_update(self, order: Dict[str, Any]) -> None:
+        product_id = self.order_products.get(order.get("order_id")) or \
+                     self.order_products.get(order.get("client_order_id"))
+        if product_id is not None:
+            self.actions.put(("order", product_id, order))
+
+    def _queue(self, state: DCAState, action: str, price: float) -> None:
+        state.busy = True
+        self.actions.put((action, state.schedule.product_id, price))
+
+    # ---- service thread ----
+    def _place(self, state: DCAState, kind: str, price: float) -> None:
+        schedule = state.schedule
+        if state.order_id and not self._cancel(state):
+            # The old order may have filled meanwhile, its update decides what happens next
+            logger.warning(f"{schedule.product_id} cancel of {state.order_id} failed, not re-pricing")
+            return
+        quote_size = schedule.monthly_budget / schedule.num_buys
+        logger.info(f"{schedule.product_id} {kind} buy of {quote_size} USD at {price}")
+        state.order_kind, state.order_price = kind, price
+        if not self.post_new_orders:
+            state.order_id = f"dry-run-{schedule.product_id}-{state.window_index}"
+            return
+        # One batch per buy window, order kind and price, so a resubmit of the same order is not a second buy.
+        # Windows only survive a restart when schedule.start is set, otherwise they start at the restart
+        batch_id = f"dca:{schedule.product_id}:{int(state.window[0])}:{kind}:{price}"
+        intent = OrderIntent(schedule.product_id, "BUY", price, quote_size=quote_size)
+        # Registered before sending, a fill can reach the user channel before the ack returns
+        state.client_order_id = self.engine.clientOrderId(batch_id, intent)
+        self.order_products[state.client_order_id] = schedule.product_id
+        acks = self.engine.submit([intent], batch_id)
+        printAcks(acks)
+        if acks and acks[0].success:
+            state.order_id = acks[0].order_id
+            self.order_products[state.order_id] = schedule.product_id
+        else:
+            self._forget(state)
+
+    def _forget(self, state: DCAState) -> None:
+        self.order_products.pop(state.order_id, None)
+        self.order_products.pop(state.client_order_id, None)
+        state.order_id, state.client_order_id, state.order_kind, state.order_price = None, None, None, None
+
+    def _cancel(self, state: DCAState) -> bool:
+        """
+        Cancels the current order, True once the exchange confirmed it. Its ids stay registered
+        until the closing update arrives, so a fill that raced the cancel is still recorded.
+        """
+        if self.post_new_orders and state.order_id:
+            cancelled = post_req.cancelledIds(post_req.cancelOrderIds([state.order_id], verbose=False))
+            if state.order_id not in cancelled:
+                return False
+            state.retired.append((state.order_id, state.client_order_id))
+            state.order_id, state.client_order_id, state.order_kind, state.order_price = None, None, None, None
+            return True
+        self._forget(state)
+        return True
+
+    def _onRetired(self, state: DCAState, ids: Tuple[Optional[str], Optional[str]], order: Dict[str, Any]) -> None:
+        status = order.get("status", "")
+        if status != "FILLED" and status not in TERMINAL_STATUSES:
+            return
+        filled_size = float(order.get("filled_size") or 0)
+        if filled_size > 0:
+            # Part of the cancelled order filled before the cancel, it is a buy of this window all the same
+            fill_price = float(order.get("average_filled_price") or 0)
+            logger.info(f"{state.schedule.product_id} cancelled DCA order filled {filled_size} at {fill_price}")
+            state.bought.append({"window": state.window_index, "price": fill_price,
+                                 "size": filled_size, "kind": "cancelled"})
+        state.retired.remove(ids)
+        for order_id in ids:
+            self.order_products.pop(order_id, None)
+
+    def _onOrder(self, state: DCAState, order: Dict[str, Any]) -> None:
+        order_ids = {order.get("order_id"), order.get("client_order_id")} - {None, ""}
+        for ids in state.retired:
+            if order_ids & set(ids):
+                self._onRetired(state, ids, order)
+                return
+        matches_order = order.get("order_id") and order.get("order_id") == state.order_id
+        matches_client = order.get("client_order_id") and order.get("client_order_id") == state.client_order_id
+        if not (matches_order or matches_client):
+            return
+        status = order.get("status", "")
+        if status == "FILLED":
+            fill_price = float(order.get("average_filled_price") or state.order_price)
+            logger.info(f"{state.schedule.product_id} DCA buy {state.window_index + 1} filled at {fill_price}")
+            state.bought.append({"window": state.window_index, "price": fill_price,
+                                 "size": float(order.get("filled_size") or 0), "kind": state.order_kind})
+            self._forget(state)
+            state.reference_price = fill_price
+            self._nextWindow(state)
+        elif status in TERMINAL_STATUSES:
+            # Cancelled outside the service, the pair goes back to watching
+            self._forget(state)
+
+    def _nextWindow(self, state: DCAState) -> None:
+        state.window_index += 1
+        if state.window is None and state.schedule.repeat:
+            last_start = state.windows[-1][0] + state.schedule.buy_window_days * 86400 / 2
+            interval_days = 30 // state.schedule.num_buys
+            next_start = datetime.datetime.fromtimestamp(last_start) + datetime.timedelta(days=interval_days)
+            state.windows, state.window_index = state.schedule.windows(next_start), 0
+
+    def _closeWindows(self) -> None:
+        now = time.time()
+        for state in self.states.values():
+            window = state.window
+            if window is None or now < window[1] or state.order_kind == "fallback":
+                continue
+            book = self.order_books.get(state.schedule.product_id)
+            best_bid = book.best_bid if book is not None else None
+            if best_bid is None:
+                logger.warning(f"{state.schedule.product_id} window closed without a live book")
+                continue
+            # No dip buy filled in time, buy at the bid instead of waiting for the dip
+            self._place(state, "fallback", best_bid)
+
+    def _nextDeadline(self) -> float:
+        ends = [state.window[1] for state in self.states.values()
+                if state.window is not None and state.order_kind != "fallback"]
+        # At least a second, a window that closed without a live book is retried
+        return max(1.0, min(ends) - time.time()) if ends else 3600.0
+
+    def _loop(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                action, product_id, payload = self.actions.get(timeout=self._nextDeadline())
+            except queue.Empty:
+                action = None
+            try:
+                if action == "order":
+                    self._onOrder(self.states[product_id], payload)
+                elif action in ("dip", "fallback"):
+                    self._place(self.states[product_id], action, payload)
+                self._closeWindows()
+            except Exception as e:
+                logger.error(f"DCA action failed: {e}")
+            finally:
+                if action is not None:
+                    self.states[product_id].busy = False
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.states:
+            self.actions.put(("stop", next(iter(self.states)), None))
+        if self.thread:
+            self.thread.join(timeout=5)
@@ -0,0 +1,229 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation, ROUND_DOWN, ROUND_UP
+from typing import Dict, List, Optional, Any, Tuple
+import api_scripts.get_request as get_req
+import api_scripts.post_requests as post_req
+from api_scripts.rate_limiter import RateLimiter
+from websocket_scripts.slippage import estimateSlippage
+
+ORDERS_ENDPOINT = "/api/v3/brokerage/orders"
+# Fixed namespace so the same order slot in the same batch always maps to the same client_order_id
+CLIENT_ORDER_NAMESPACE = uuid.UUID("5b0e4c6a-2f0e-4a53-9a55-1c1f3c0ad7e1")
+
+
+@dataclass
+class OrderIntent:
+    """Order decision before rounding, either base_size or quote_size (USD amount) is set"""
+    product_id: str
+    side: str
+    limit_price: Any
+    base_size: Any = None
+    quote_size: Any = None
+    order_type: str = "limit"  # "limit" (post only) or "stop_limit"
+    stop_price: Any = None
+    decision_time: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class OrderAck:
+    intent: OrderIntent
+    client_order_id: str = ""
+    success: bool = False
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    limit_price: Optional[str] = None
+    base_size: Optional[str] = None
+    slippage_bps: Optional[float] = None  # if the size was taken from the book
+    latency_ms: Optional[float] = None  # decision to ack
+    request_ms: Optional[float] = None  # request send to ack
+
+
+class ProductRulesCache:
+    """Caches getProductInfo results, the increments and minimums rarely change"""
+
+    def __init__(self, ttl_seconds: float = 3600):
+        self.ttl_seconds = ttl_seconds
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        self.fetched_at: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            cached = self.rules.get(product_id)
+            if cached and time.monotonic() - self.fetched_at[product_id] < self.ttl_seconds:
+                return cached
+        info = get_req.getProductInfo(product_id)
+        if not info or 'price' not in info:
+            return None
+        with self.lock:
+            self.rules[product_id] = info
+            self.fetched_at[product_id] = time.monotonic()
+        return info
+
+    def prefetch(self, product_ids: List[str], max_workers: int = 8) -> None:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self.get, set(product_ids)))
+
+
+def roundToIncrement(value, increment, rounding=ROUND_DOWN) -> Decimal:
+    increment = Decimal(increment)
+    return (Decimal(value) / increment).to_integral_value(rounding=rounding) * increment
+
+
+class OrderEngine:
+    """
+    Validates intents against cached product rules and submits them concurrently
+    under a rate limit. submit() returns one OrderAck per intent, in input order.
+    With live books and max_slippage_bps set, intents whose size would move the
+    price more than that when taken from the book are rejected.
+    """
+
+    def __init__(self, rules_cache: Optional[ProductRulesCache] = None, max_workers: int = 8,
+                 rate_per_sec: float = 10.0, burst: int = 10, books: Optional[Dict[str, Any]] = None,
+                 max_slippage_bps: Optional[float] = None):
+        self.rules_cache = rules_cache or ProductRulesCache()
+        self.books = books
+        self.max_slippage_bps = max_slippage_bps
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(rate_per_sec, burst)
+
+    @staticmethod
+    def clientOrderId(batch_id: str, intent: OrderIntent, occurrence: int = 0) -> str:
+        """
+        Prices and sizes are left out of the key, a rerun of the batch recomputes them from
+        newer books but has to map to the same ids. occurrence numbers repeated order slots.
+        """
+        key = f"{batch_id}:{intent.product_id}:{intent.side.upper()}:{intent.order_type}:{occurrence}"
+        return str(uuid.uuid5(CLIENT_ORDER_NAMESPACE, key))
+
+    def prepare(self, intent: OrderIntent, batch_id: str,
+                occurrence: int = 0) -> Tuple[OrderAck, Optional[Dict[str, Any]]]:
+        """Rounds price and size, returns the ack to fill and the payload or None if invalid"""
+        ack = OrderAck(intent=intent, client_order_id=self.clientOrderId(batch_id, intent, occurrence))
+        try:
+            return self._prepare(ack)
+        except (InvalidOperation, ZeroDivisionError, TypeError, ValueError) as e:
+            # A bad intent fails on its own instead of aborting the batch
+            ack.error = f"Invalid order values: {e!r}"
+            return ack, None
+
+    def _prepare(self, ack: OrderAck) -> Tuple[OrderAck, Optional[Dict[str, Any]]]:
+        intent = ack.intent
+        side = intent.side.upper()
+        if intent.order_type == "stop_limit" and intent.stop_price is None:
+            ack.error = "Stop limit order without a stop price"
+            return ack, None
+        info = self.rules_cache.get(intent.product_id)
+        if info is None:
+            ack.error = "Failed to fetch product info"
+            return ack, None
+        if info.get('trading_disabled') or info.get('is_disabled'):
+            ack.error = "Trading disabled"
+            return ack, None
+
+        # Buys round the price down and sells up so post only orders stay on the maker side
+        price_rounding = ROUND_DOWN if side == "BUY" else ROUND_UP
+        limit_price = roundToIncrement(intent.limit_price, info['quote_increment'], price_rounding)
+        if limit_price <= 0:
+            ack.error = f"Limit price {intent.limit_price} rounds to {limit_price}"
+            return ack, None
+        if intent.base_size is not None:
+            base_size = Decimal(intent.base_size)
+        else:
+            base_size = Decimal(intent.quote_size) / limit_price
+        base_size = roundToIncrement(base_size, info['base_increment'])
+
+        min_order_size = Decimal(info['base_min_size'])
+        max_order_size = Decimal(info.get('base_max_size') or "Infinity")
+        if base_size < min_order_size:
+            ack.error = f"Order too small: {base_size} < min {min_order_size}"
+            return ack, None
+        if base_size > max_order_size:
+            ack.error = f"Order too large: {base_size} > max {max_order_size}"
+            return ack, None
+
+        if self.books is not None and self.max_slippage_bps is not None:
+            estimate = estimateSlippage(self.books, [float(base_size)], side=side.lower(),
+                                        product_ids=[intent.product_id]).get(intent.product_id)
+            if estimate is not None:
+                # The walk has no price for sizes deeper than the book
+                if not estimate["filled"][0]:
+                    ack.error = f"Book too shallow for size {base_size}"
+                    return ack, None
+                ack.slippage_bps = float(estimate["slippage_bps"][0])
+                if ack.slippage_bps > self.max_slippage_bps:
+                    ack.error = f"Slippage {ack.slippage_bps:.1f} bps above max {self.max_slippage_bps}"
+                    return ack, None
+
+        ack.limit_price = str(limit_price)
+        ack.base_size = str(base_size)
+        if intent.order_type == "stop_limit":
+            stop_price = roundToIncrement(intent.stop_price, info['quote_increment'], price_rounding)
+            payload = post_req.stopLimitOrderPayload(intent.product_id, str(stop_price), ack.limit_price,
+                                                     ack.base_size, side, ack.client_order_id)
+        else:
+            payload = post_req.limitOrderPayload(intent.product_id, ack.limit_price, ack.base_size,
+                                                 side, ack.client_order_id)
+        return ack, payload
+
+    def _send(self, ack: OrderAck, payload: Dict[str, Any]) -> OrderAck:
+        self.rate_limiter.acquire()
+        request_start = time.perf_counter()
+        try:
+            response = post_req.postApiAdvanced(ORDERS_ENDPOINT, payload, verbose=False)
+        except Exception as e:
+            ack.error = str(e)
+            return ack
+        now = time.perf_counter()
+        ack.request_ms = (now - request_start) * 1000
+        ack.latency_ms = (now - ack.intent.decision_time) * 1000
+        ack.status_code = response.status_code
+        try:
+            data = response.json()
+        except ValueError:
+            ack.error = response.text
+            return ack
+
+        ack.success = bool(data.get("success"))
+        if ack.success:
+            ack.order_id = data.get("success_response", {}).get("order_id")
+        else:
+            error_response = data.get("error_response", {})
+            ack.error = error_response.get("message") or data.get("failure_reason") or str(data)
+        return ack
+
+    def submit(self, intents: List[OrderIntent], batch_id: str) -> List[OrderAck]:
+        """
+        batch_id makes client_order_ids deterministic, resubmitting the same batch
+        after a crash returns the existing orders instead of double buying. Callers
+        use a new id per run and only reuse one to resume that interrupted run.
+        """
+        self.rules_cache.prefetch([intent.product_id for intent in intents], self.max_workers)
+        occurrences = defaultdict(int)
+        prepared = []
+        for intent in intents:
+            slot = (intent.product_id, intent.side.upper(), intent.order_type)
+            prepared.append(self.prepare(intent, batch_id, occurrences[slot]))
+            occurrences[slot] += 1
+
+        acks = [ack for ack, _ in prepared]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._send, ack, payload) for ack, payload in prepared if payload]
+            for future in futures:
+                future.result()
+        return acks
+
+
+def printAcks(acks: List[OrderAck]) -> None:
+    for ack in acks:
+        if ack.success:
+            print(f"✅ {ack.intent.side} {ack.intent.product_id} {ack.base_size} @ {ack.limit_price} "
+                  f"order {ack.order_id} in {ack.latency_ms:.0f} ms")
+        else:
+            print(f"❌ {ack.intent.side} {ack.intent.product_id}: {ack.error}")
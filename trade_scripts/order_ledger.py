@@ -0,0 +1,203 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+import api_scripts.get_request as api_get
+
+LEDGER_PATH = "data/ledger.sqlite"
+# Orders in these states can still change and are refreshed on every sync
+OPEN_STATUSES = ("OPEN", "PENDING", "QUEUED")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    product_id TEXT,
+    side TEXT,
+    status TEXT,
+    order_type TEXT,
+    created_time TEXT,
+    filled_size REAL,
+    average_filled_price REAL,
+    total_fees REAL,
+    raw TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_orders_product ON orders (product_id, side, status);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, created_time);
+CREATE INDEX IF NOT EXISTS idx_orders_time ON orders (created_time);
+
+CREATE TABLE IF NOT EXISTS fills (
+    entry_id TEXT PRIMARY KEY,
+    order_id TEXT,
+    product_id TEXT,
+    side TEXT,
+    trade_time TEXT,
+    price REAL,
+    size REAL,
+    commission REAL
+);
+CREATE INDEX IF NOT EXISTS idx_fills_product ON fills (product_id, side, trade_time);
+CREATE INDEX IF NOT EXISTS idx_fills_time ON fills (trade_time);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    cursor TEXT
+);
+"""
+
+
+def toFloat(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class OrderLedger:
+    """
+    Local SQLite copy of the order and fill history.
+    sync() only downloads records newer than the stored cursor, afterwards
+    position and cost queries run locally.
+    """
+
+    def __init__(self, db_path: str = LEDGER_PATH):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _getCursor(self, name: str) -> Optional[str]:
+        row = self.conn.execute("SELECT cursor FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row["cursor"] if row else None
+
+    def _setCursor(self, name: str, cursor: Optional[str]) -> None:
+        if cursor:
+            self.conn.execute("INSERT OR REPLACE INTO sync_state (name, cursor) VALUES (?, ?)", (name, cursor))
+
+    def _storeOrders(self, orders) -> Optional[str]:
+        latest_time = None
+        rows = []
+        for order in orders:
+            created_time = order.get("created_time", "")
+            latest_time = max(latest_time or created_time, created_time)
+            rows.append((
+                order["order_id"],
+                order.get("product_id", ""),
+                order.get("side", "").upper(),
+                order.get("status", "").upper(),
+                order.get("order_type", "").upper(),
+                created_time,
+                toFloat(order.get("filled_size")),
+                toFloat(order.get("average_filled_price")),
+                toFloat(order.get("total_fees")),
+                json.dumps(order),
+            ))
+        self.conn.executemany("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return latest_time
+
+    def _storeFills(self, fills) -> Optional[str]:
+        latest_time = None
+        rows = []
+        for fill in fills:
+            trade_time = fill.get("trade_time", "")
+            latest_time = max(latest_time or trade_time, trade_time)
+            rows.append((
+                fill.get("entry_id") or fill["trade_id"],
+                fill.get("order_id", ""),
+                fill.get("product_id", ""),
+                fill.get("side", "").upper(),
+                trade_time,
+                toFloat(fill.get("price")),
+                toFloat(fill.get("size")),
+                toFloat(fill.get("commission")),
+            ))
+        # Fills never change, re-fetched boundary records are ignored
+        self.conn.executemany("INSERT OR IGNORE INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return latest_time
+
+    def sync(self) -> Dict[str, int]:
+        """Fetches only orders and fills newer than the last sync plus the orders still open locally"""
+        orders_before = self.conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        fills_before = self.conn.execute("SELECT COUNT(*) FROM fills").fetchone()[0]
+
+        open_ids = [row["order_id"] for row in self.conn.execute(
+            f"SELECT order_id FROM orders WHERE status IN ({','.join('?' * len(OPEN_STATUSES))})",
+            OPEN_STATUSES)]
+        for i in range(0, len(open_ids), 100):
+            self._storeOrders(api_get.iterOrders(order_ids=open_ids[i:i + 100]))
+
+        # The boundary record is fetched again, the primary keys dedup it
+        latest_order = self._storeOrders(api_get.iterOrders(start_date=self._getCursor("orders")))
+        self._setCursor("orders", latest_order)
+        latest_fill = self._storeFills(api_get.iterFills(start_date=self._getCursor("fills")))
+        self._setCursor("fills", latest_fill)
+        self.conn.commit()
+
+        return {
+            "new_orders": self.conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] - orders_before,
+            "new_fills": self.conn.execute("SELECT COUNT(*) FROM fills").fetchone()[0] - fills_before,
+        }
+
+    def queryOrders(self, status=None, side=None, order_type=None, product_id=None, since=None) -> List[Dict[str, Any]]:
+        """Returns the raw order dicts, order_type matches as substring like getBuyOrders"""
+        query = "SELECT raw FROM orders WHERE 1 = 1"
+        args = []
+        if status:
+            query += " AND status = ?"
+            args.append(status.upper())
+        if side:
+            query += " AND side = ?"
+            args.append(side.upper())
+        if order_type:
+            query += " AND order_type LIKE ?"
+            args.append(f"%{order_type.upper()}%")
+        if product_id:
+            query += " AND product_id = ?"
+            args.append(product_id)
+        if since:
+            query += " AND created_time >= ?"
+            args.append(api_get.toRFC3339(since))
+        query += " ORDER BY created_time"
+        return [json.loads(row["raw"]) for row in self.conn.execute(query, args)]
+
+    def _fillFilter(self, product_id=None, since=None):
+        query = ""
+        args = []
+        if product_id:
+            query += " AND product_id = ?"
+            args.append(product_id)
+        if since:
+            query += " AND trade_time >= ?"
+            args.append(api_get.toRFC3339(since))
+        return query, args
+
+    def positions(self, product_id=None, since=None) -> Dict[str, Dict[str, float]]:
+        """Bought, sold and net base quantity per product"""
+        query, args = self._fillFilter(product_id, since)
+        rows = self.conn.execute(
+            "SELECT product_id,"
+            " SUM(CASE WHEN side = 'BUY' THEN size ELSE 0 END) AS bought,"
+            " SUM(CASE WHEN side = 'SELL' THEN size ELSE 0 END) AS sold"
+            f" FROM fills WHERE 1 = 1{query} GROUP BY product_id", args)
+        return {row["product_id"]: {"bought": row["bought"], "sold": row["sold"],
+                                    "net_qty": row["bought"] - row["sold"]} for row in rows}
+
+    def averageCost(self, side="BUY", product_id=None, since=None) -> Dict[str, Dict[str, float]]:
+        """Fee inclusive weighted average price with total quantity and cost per product"""
+        query, args = self._fillFilter(product_id, since)
+        rows = self.conn.execute(
+            "SELECT product_id, SUM(size) AS total_qty, SUM(price * size + commission) AS total_cost"
+            f" FROM fills WHERE side = ?{query} GROUP BY product_id HAVING SUM(size) > 0",
+            [side.upper()] + args)
+        return {row["product_id"]: {"avg_price": row["total_cost"] / row["total_qty"],
+                                    "total_qty": row["total_qty"],
+                                    "total_cost": row["total_cost"]} for row in rows}
+
+    def fees(self, product_id=None, since=None) -> Dict[str, float]:
+        """Total commission paid per product"""
+        query, args = self._fillFilter(product_id, since)
+        rows = self.conn.execute(
+            f"SELECT product_id, SUM(commission) AS fees FROM fills WHERE 1 = 1{query} GROUP BY product_id", args)
+        return {row["product_id"]: row["fees"] for row in rows}
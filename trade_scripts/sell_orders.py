@@ -1,31 +1,34 @@
+import time
 import api_scripts.get_request as get_req
 import api_scripts.post_requests as post_req
 from decimal import Decimal, ROUND_DOWN
+from trade_scripts.order_engine import OrderEngine, OrderIntent, printAcks
 
 def roundingAmount(product_info, balance_amount):
     base_increment = product_info['base_increment']
     rounded_base_size = Decimal(balance_amount).quantize(Decimal(base_increment), rounding=ROUND_DOWN)
     return rounded_base_size
 
-def sellPortFolio(percentage_of_portfolio=0.1):
-    portfolio_dict = get_req.getPortfolio(min_value_usdc=20, fiat_currency="USD")
+def sellPortFolio(percentage_of_portfolio=0.1, engine=None, batch_id=None):
+    portfolio_dict = get_req.getPortfolio(min_value_usdc=20, fiat_currency="USD", use_oracle=True)
     product_ids = list(portfolio_dict.keys())
-    prices = get_req.getCurrentBestBidAsk(product_ids)
+    prices = get_req.getCurrentBestBidAsk(product_ids, use_oracle=True)
+    intents = []
     for product_id, balance_amount in portfolio_dict.items():
-        product_info = get_req.getProductInfo(product_id)
-        if 'price' not in product_info:
-            print(f"❌ Failed to fetch product info for {product_id}")
+        if product_id not in prices:
+            print(f"❌ Failed to fetch price for {product_id}")
             continue
-        best_ask_price = Decimal(prices[product_id]["asks"][0]["price"])
-
+        best_ask_price = prices[product_id]["asks"][0]["price"]
         sell_amount = balance_amount * percentage_of_portfolio
-        sell_size = roundingAmount(product_info, sell_amount)
-        min_order_size = Decimal(product_info['base_min_size'])
-        if sell_size < min_order_size:
-            print(f"⚠️ Order for {product_id} too small: {sell_size} < min {min_order_size}")
-            continue
+        intents.append(OrderIntent(product_id, "SELL", best_ask_price, base_size=sell_amount))
 
-        post_req.sellLimitOrder(product_id, str(best_ask_price), str(sell_size))
+    # Every run is a new batch, pass the batch id printed by an interrupted run to resume it
+    # without selling twice
+    batch_id = batch_id or f"sell-portfolio:{time.time_ns()}"
+    print(f"Batch {batch_id}")
+    acks = (engine or OrderEngine()).submit(intents, batch_id)
+    printAcks(acks)
+    return acks
 
 
 from collections import defaultdict
@@ -73,15 +76,27 @@ def find_wall(order_book, side, price_window=0.05, wall_factor=10, tick_group=.1
 
     return None
 
+def stopLimitPrices(order_book, price_window=0.1, wall_factor=1, tick_group=.01, limit_factor=0.99):
+    "Stop at the first bid wall below mid, limit just under it. None if no wall is found."
+    wall = find_wall(order_book, "sell", price_window=price_window, wall_factor=wall_factor, tick_group=tick_group)
+    if wall is None:
+        return None
+    stop_price = wall["wall_price"]
+    return stop_price, stop_price * limit_factor
+
 def updateStopLimit(post_new_orders=False):
-    portfolio_dict = get_req.getPortfolio(min_value_usdc=20, fiat_currency="USD", include_holds=True)
+    portfolio_dict = get_req.getPortfolio(min_value_usdc=20, fiat_currency="USD", include_holds=True,
+                                         use_oracle=True)
 
     for trade_pair_id, balance_amount in portfolio_dict.items():
         books = get_req.getOrderBook(trade_pair_id, detail_level=2)
         # Find prices based on the order book walls
-        test = find_wall(books, "sell", price_window=0.1, wall_factor=1, tick_group=.01)
-        stop_price = test["wall_price"]
-        limit_price = round(stop_price * 0.99, 2)
+        prices = stopLimitPrices(books, price_window=0.1, wall_factor=1, tick_group=.01)
+        if prices is None:
+            print(f"⚠️ No bid wall found for {trade_pair_id}")
+            continue
+        stop_price = prices[0]
+        limit_price = round(prices[1], 2)
         # Round if there are too many decimals
         # Amount quantities allowed is also different per trade-pair
         product_info = get_req.getProductInfo(trade_pair_id)
@@ -95,4 +110,6 @@ def updateStopLimit(post_new_orders=False):
         if post_new_orders:
             post_req.placeStopLimitOrder(trade_pair_id, str(stop_price), str(limit_price),
                                      str(sell_size), "SELL")
-updateStopLimit(post_new_orders=True)
\ No newline at end of file
+
+if __name__ == "__main__":
+    updateStopLimit(post_new_orders=True)
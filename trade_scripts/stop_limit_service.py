@@ -0,0 +1,183 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Any
+import api_scripts.get_request as get_req
+import api_scripts.post_requests as post_req
+from trade_scripts.order_engine import OrderEngine, OrderIntent, printAcks
+from trade_scripts.sell_orders import stopLimitPrices
+
+logger = logging.getLogger(__name__)
+
+
+def bookToLevel2(book, levels: int = 5000) -> Optional[Dict[str, List]]:
+    """Live BaseOrderBook in the REST level2 shape find_wall expects, [price, size, num_orders]"""
+    bids, asks = book.get_depth_data(levels)
+    if not bids or not asks:
+        return None
+    return {"bids": [(price, size, 0) for price, size in bids],
+            "asks": [(price, size, 0) for price, size in asks]}
+
+
+class StopLimitService:
+    """
+    Keeps a protective stop-limit sell per holding anchored on the live bid walls.
+    Books come from the websocket tracker, products are re-evaluated when their book
+    changes (on_book_update) or every interval seconds, and a stop is only replaced
+    when the wall moved more than move_threshold.
+    """
+
+    def __init__(self, order_books: Dict[str, Any], open_orders=None, engine: Optional[OrderEngine] = None,
+                 move_threshold: float = 0.005, interval: float = 60.0, post_new_orders: bool = False,
+                 price_window: float = 0.1, wall_factor: float = 1, tick_group: float = .01,
+                 holdings_interval: float = 600.0, max_workers: int = 8):
+        self.order_books = order_books
+        self.open_orders = open_orders
+        self.engine = engine or OrderEngine(max_workers=max_workers)
+        self.move_threshold = move_threshold
+        self.interval = interval
+        self.post_new_orders = post_new_orders
+        self.wall_params = {"price_window": price_window, "wall_factor": wall_factor, "tick_group": tick_group}
+        self.holdings_interval = holdings_interval
+        self.max_workers = max_workers
+        # Products held, including balances on hold, and their available balance
+        self.holdings: Dict[str, float] = {}
+        self.available: Dict[str, float] = {}
+        self.holdings_time = 0.0
+        # product_id -> {"stop_price": float, "order_id": str, "size": float}
+        self.active_stops: Dict[str, Dict[str, Any]] = {}
+        self.dirty: Set[str] = set()
+        self.dirty_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def refresh_holdings(self) -> None:
+        portfolio_data = get_req.getApiAdvanced("/api/v3/brokerage/accounts")
+        self.holdings_time = time.monotonic()
+        if not portfolio_data:
+            return
+        balances = get_req.portfolioBalances(portfolio_data, "USD", include_holds=True)
+        self.holdings = {product_id: total for product_id, (_, total) in balances.items()}
+        self.available = {product_id: available for product_id, (available, _) in balances.items()}
+
+    def sell_size(self, product_id: str) -> float:
+        """
+        Available balance plus the hold of our own stop, which is cancelled before the new one
+        goes out. Holds of other open orders stay locked and are not sold.
+        """
+        return self.available.get(product_id, 0.0) + self.active_stops.get(product_id, {}).get("size", 0.0)
+
+    def seed_from_open_orders(self) -> None:
+        if self.open_orders is None:
+            return
+        for order in self.open_orders.query(side="SELL", order_type="STOP_LIMIT", status="OPEN"):
+            # Orders are placed on the USDC book, the tracker follows the USD book
+            product_id = order["product_id"][:-1] if order["product_id"].endswith("USDC") else order["product_id"]
+            self.active_stops[product_id] = {"stop_price": float(order.get("stop_price") or 0),
+                                             "order_id": order["order_id"],
+                                             "size": float(order.get("leaves_quantity") or 0)}
+
+    def on_book_update(self, product_id: str, book) -> None:
+        """Tracker book listener, only marks the product, work happens on the service thread"""
+        if product_id in self.holdings:
+            with self.dirty_lock:
+                self.dirty.add(product_id)
+            self.wake.set()
+
+    def target(self, product_id: str):
+        book = self.order_books.get(product_id)
+        order_book = bookToLevel2(book) if book is not None else None
+        if order_book is None:
+            return None
+        return stopLimitPrices(order_book, **self.wall_params)
+
+    def needs_move(self, product_id: str, stop_price: float) -> bool:
+        active = self.active_stops.get(product_id)
+        if not active or not active["stop_price"]:
+            return True
+        return abs(stop_price - active["stop_price"]) / active["stop_price"] >= self.move_threshold
+
+    def run_once(self, product_ids: List[str]):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            targets = dict(zip(product_ids, executor.map(self.target, product_ids)))
+
+        intents = []
+        for product_id, prices in targets.items():
+            if prices is None or not self.needs_move(product_id, prices[0]):
+                continue
+            stop_price, limit_price = prices
+            sell_size = self.sell_size(product_id)
+            if sell_size <= 0:
+                continue
+            logger.info(f"{product_id} stop {stop_price} limit {limit_price} size {sell_size}")
+            intents.append(OrderIntent(product_id, "SELL", limit_price, base_size=sell_size,
+                                       order_type="stop_limit", stop_price=stop_price))
+        if not intents or not self.post_new_orders:
+            return []
+
+        # Coinbase cannot edit stop orders, so the old stops are cancelled in one batch first
+        old_ids = {intent.product_id: self.active_stops[intent.product_id]["order_id"] for intent in intents
+                   if self.active_stops.get(intent.product_id, {}).get("order_id")}
+        if old_ids:
+            cancelled = post_req.cancelledIds(post_req.cancelOrderIds(list(old_ids.values()), verbose=False))
+            # A stop that is still live keeps its hold and stays tracked, it is retried on the next run
+            failed = {product_id for product_id, order_id in old_ids.items() if order_id not in cancelled}
+            if failed:
+                logger.warning(f"Cancel failed, keeping the current stops of {sorted(failed)}")
+                intents = [intent for intent in intents if intent.product_id not in failed]
+            if not intents:
+                return []
+        # Every move is a new order, the batch is unique per run of the service thread
+        acks = self.engine.submit(intents, f"stop-limit:{time.time_ns()}")
+        for ack in acks:
+            product_id = ack.intent.product_id
+            # The old stop was cancelled and its hold released, the new one holds its own size
+            old_size = self.active_stops.pop(product_id, {}).get("size", 0.0)
+            available = self.available.get(product_id, 0.0) + old_size
+            if ack.success:
+                size = float(ack.base_size)
+                self.active_stops[product_id] = {"stop_price": float(ack.intent.stop_price),
+                                                 "order_id": ack.order_id, "size": size}
+                available -= size
+            self.available[product_id] = max(available, 0.0)
+        printAcks(acks)
+        return acks
+
+    def _loop(self) -> None:
+        if self.open_orders is not None:
+            # Seeding before the user channel snapshot would miss existing stops and place them again
+            while not self.open_orders.wait_for_snapshot(timeout=10.0):
+                if self.stopped.is_set():
+                    return
+                logger.info("Waiting for the user order snapshot before placing stops")
+            self.seed_from_open_orders()
+        next_full_run = 0.0
+        while not self.stopped.is_set():
+            self.wake.wait(timeout=self.interval)
+            self.wake.clear()
+            with self.dirty_lock:
+                product_ids, self.dirty = self.dirty, set()
+            try:
+                if time.monotonic() - self.holdings_time >= self.holdings_interval:
+                    self.refresh_holdings()
+                if time.monotonic() >= next_full_run:
+                    product_ids = set(self.holdings)
+                    next_full_run = time.monotonic() + self.interval
+                self.run_once([product_id for product_id in product_ids if product_id in self.holdings])
+            except Exception as e:
+                logger.error(f"Stop limit update failed: {e}")
+            # Coalesce bursts of book updates, busy books are evaluated at most once a second
+            self.stopped.wait(timeout=min(1.0, self.interval))
+
+    def start(self) -> None:
+        self.refresh_holdings()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=5)
@@ -2,6 +2,7 @@ import pickle
 import csv
 import os
 import pandas as pd
+import numpy as np
 import gzip
 import json
 
@@ -55,14 +56,14 @@ def saveCSV(data, fieldnames, filename="data.csv"):
         print(f"Error saving to CSV: {e}")
 
 
-def readCSV(file_path):
+def readCSV(file_path, compact=False):
     try:
         # Check if the file exists
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"The file at path '{file_path}' does not exist.")
         # Read the CSV file
         data = pd.read_csv(file_path)
-        return data
+        return compactCandles(data) if compact else data
 
     except FileNotFoundError as e:
         print(e)
@@ -82,14 +83,95 @@ def saveHistoricalDataCSV(data_dict, fieldnames, filename="data.csv"):
     """
     try:
         with open(filename, mode="a", newline="") as file:
-            writer = csv.DictWriter(file, fieldnames)
+            writer = csv.writer(file)
             # Write the header if the file is empty
             file.seek(0, 2)  # Move to the end of the file
             if file.tell() == 0:  # Check if the file is empty
-                writer.writeheader()
+                writer.writerow(fieldnames)
+            # Candle rows are already in fieldnames order
             for timestamp_begin, timestamp_data in data_dict.items():
-                for row_values in timestamp_data:
-                    row_dict = dict(zip(fieldnames, row_values))
-                    writer.writerow(row_dict)
+                writer.writerows(timestamp_data)
     except Exception as e:
         print(f"Error saving to CSV: {e}")
+
+
+# Column order of the candles endpoint
+CANDLE_COLUMNS = ["timestamp", "low", "high", "open", "close", "volume"]
+
+
+def frameMemory(df):
+    """Deep memory usage of a frame in bytes, object strings included"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def compactCandles(df, float_rtol=1e-6, verbose=True):
+    """
+    Copy of a candle frame with a categorical pair column, int64 epoch timestamps and
+    float32 columns where the cast stays within float_rtol. The date index is kept.
+    """
+    compact = df.copy()
+    for column in compact.columns:
+        values = compact[column]
+        if column == "pair" and not isinstance(values.dtype, pd.CategoricalDtype):
+            compact[column] = values.astype("category")
+        elif column == "timestamp" and pd.api.types.is_datetime64_any_dtype(values):
+            compact[column] = values.astype("datetime64[s]").astype(np.int64)
+        elif pd.api.types.is_float_dtype(values) and values.dtype != np.float32:
+            as_float32 = values.to_numpy().astype(np.float32)
+            if np.allclose(as_float32, values.to_numpy(), rtol=float_rtol, atol=0, equal_nan=True):
+                compact[column] = as_float32
+    if verbose:
+        before, after = frameMemory(df), frameMemory(compact)
+        print(f"Compacted frame from {before / 1e6:.2f} MB to {after / 1e6:.2f} MB "
+              f"({(1 - after / max(before, 1)) * 100:.0f}% saved)")
+    return compact
+
+
+def candlesToArray(candles):
+    """[[ts, low, high, open, close, volume], ...] as one (n, 6) float64 array"""
+    return np.asarray(candles, dtype=np.float64).reshape(-1, len(CANDLE_COLUMNS))
+
+
+def candlesToFrame(dict_data):
+    """
+    {pair: candles} as one DataFrame with a categorical pair column and datetime timestamps.
+    One array conversion per pair, the rest is vectorised.
+    """
+    pairs = [pair for pair, candles in dict_data.items() if len(candles)]
+    arrays = [candlesToArray(dict_data[pair]) for pair in pairs]
+    values = np.concatenate(arrays) if arrays else np.empty((0, len(CANDLE_COLUMNS)))
+    codes = np.repeat(np.arange(len(pairs)), [len(array) for array in arrays])
+    df = pd.DataFrame({
+        "pair": pd.Categorical.from_codes(codes, categories=pairs),
+        "timestamp": pd.to_datetime(values[:, 0].astype(np.int64), unit="s"),
+    })
+    for i, column in enumerate(CANDLE_COLUMNS[1:], start=1):
+        df[column] = values[:, i]
+    return df[["pair", "timestamp", "open", "high", "low", "close", "volume"]]
+
+
+def tailMaxValue(filename, column="timestamp", block_size=64 * 1024):
+    """
+    Largest value of a numeric column in the last block_size bytes of a CSV.
+    Slices are appended in time order, so for candle CSVs this is the newest timestamp
+    without parsing the whole file. Returns None for a missing or empty file.
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "rb") as file:
+        header = file.readline().decode("utf-8").strip().split(",")
+        if column not in header:
+            return None
+        column_index = header.index(column)
+        file_size = file.seek(0, 2)
+        file.seek(max(0, file_size - block_size))
+        lines = file.read().decode("utf-8").splitlines()
+    # The first line of the block may be cut off (or be the header)
+    values = []
+    for line in lines[1:] if file_size > block_size else lines:
+        fields = line.split(",")
+        try:
+            values.append(float(fields[column_index]))
+        except (IndexError, ValueError):
+            continue
+    return max(values) if values else None
@@ -0,0 +1,283 @@
+import glob
+import gzip
+import heapq
+import json
+import itertools
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Any
+
+
+class BookEvent(NamedTuple):
+    """One recorded book state, bids/asks are [price, size] lists or None for light recordings"""
+    ts: float
+    product_id: str
+    best_bid: Optional[float]
+    best_ask: Optional[float]
+    bids: Optional[List]
+    asks: Optional[List]
+
+
+def parseRecord(line: str) -> Optional[BookEvent]:
+    """A line of a FullOrderBookState or LightOrderBookState recording"""
+    record = json.loads(line)
+    if "bids" in record:
+        bids, asks = record["bids"], record["asks"]
+        return BookEvent(datetime.fromisoformat(record["timestamp"]).timestamp(), record["product_id"],
+                         bids[0][0] if bids else None, asks[0][0] if asks else None, bids, asks)
+    if "bb" in record:
+        return BookEvent(datetime.fromisoformat(record["t"]).timestamp(), record["p"],
+                         record["bb"], record["ba"], None, None)
+    return None
+
+
+def readRecording(path: str) -> Iterator[BookEvent]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = parseRecord(line)
+            except (json.JSONDecodeError, KeyError, ValueError):
+                continue
+            if event is not None and event.best_bid is not None and event.best_ask is not None:
+                yield event
+
+
+def mergeRecordings(paths: Iterable[str]) -> Iterator[BookEvent]:
+    """All recordings as one time ordered stream, every file is already in time order"""
+    return heapq.merge(*(readRecording(path) for path in paths), key=lambda event: event.ts)
+
+
+@dataclass
+class SimOrder:
+    order_id: int
+    product_id: str
+    side: str  # "BUY" or "SELL"
+    order_type: str  # "limit" (post-only) or "stop_limit"
+    limit_price: float
+    base_size: float
+    stop_price: Optional[float] = None
+    placed_ts: float = 0.0
+    triggered: bool = False
+
+
+@dataclass
+class Fill:
+    ts: float
+    order_id: int
+    product_id: str
+    side: str
+    order_type: str
+    price: float
+    base_size: float
+    fee: float
+    maker: bool
+    wait_seconds: float
+
+
+@dataclass
+class Account:
+    cash: float = 0.0
+    positions: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    cost_basis: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    realized_pnl: float = 0.0
+    fees: float = 0.0
+
+
+class BookReplay:
+    """
+    Event driven simulator over recorded books.
+
+    Post-only limit buys rest at their price, they are rejected when they would cross
+    the ask on placement and fill (maker) once the best ask trades down to them.
+    Stop-limit sells trigger when the best bid drops to the stop, then fill (taker) at
+    the best bid as long as it is at or above the limit price.
+    """
+
+    def __init__(self, strategy, maker_fee: float = 0.004, taker_fee: float = 0.006, starting_cash: float = 0.0):
+        self.strategy = strategy
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.account = Account(cash=starting_cash)
+        self.open_orders: Dict[str, Dict[int, SimOrder]] = defaultdict(dict)
+        self.fills: List[Fill] = []
+        self.rejected = 0
+        self.events = 0
+        self.last_event: Dict[str, BookEvent] = {}
+        self.now = 0.0
+        self._order_ids = itertools.count(1)
+
+    # ---- order entry, called by strategies ----
+    def placeLimitBuy(self, product_id: str, limit_price: float, base_size: float) -> Optional[int]:
+        event = self.last_event.get(product_id)
+        if event is not None and limit_price >= event.best_ask:
+            # Post-only would take liquidity
+            self.rejected += 1
+            return None
+        order = SimOrder(next(self._order_ids), product_id, "BUY", "limit", limit_price, base_size, placed_ts=self.now)
+        self.open_orders[product_id][order.order_id] = order
+        return order.order_id
+
+    def placeStopLimitSell(self, product_id: str, stop_price: float, limit_price: float,
+                           base_size: float) -> int:
+        order = SimOrder(next(self._order_ids), product_id, "SELL", "stop_limit", limit_price, base_size,
+                         stop_price=stop_price, placed_ts=self.now)
+        self.open_orders[product_id][order.order_id] = order
+        return order.order_id
+
+    def cancel(self, product_id: str, order_id: int) -> bool:
+        return self.open_orders[product_id].pop(order_id, None) is not None
+
+    def orders(self, product_id: str, side: Optional[str] = None) -> List[SimOrder]:
+        return [order for order in self.open_orders[product_id].values() if side is None or order.side == side]
+
+    # ---- matching ----
+    def _fill(self, order: SimOrder, price: float, maker: bool) -> None:
+        notional = price * order.base_size
+        fee = notional * (self.maker_fee if maker else self.taker_fee)
+        account = self.account
+        account.fees += fee
+        if order.side == "BUY":
+            account.cash -= notional + fee
+            account.positions[order.product_id] += order.base_size
+            account.cost_basis[order.product_id] += notional + fee
+        else:
+            position = account.positions[order.product_id]
+            size = min(order.base_size, position) if position > 0 else order.base_size
+            avg_cost = account.cost_basis[order.product_id] / position if position > 0 else 0.0
+            account.cash += notional - fee
+            account.realized_pnl += notional - fee - avg_cost * size
+            account.positions[order.product_id] = position - order.base_size
+            account.cost_basis[order.product_id] -= avg_cost * size
+        fill = Fill(self.now, order.order_id, order.product_id, order.side, order.order_type, price,
+                    order.base_size, fee, maker, self.now - order.placed_ts)
+        self.fills.append(fill)
+        del self.open_orders[order.product_id][order.order_id]
+        on_fill = getattr(self.strategy, "on_fill", None)
+        if on_fill:
+            on_fill(self, fill)
+
+    def _match(self, event: BookEvent) -> None:
+        for order in list(self.open_orders[event.product_id].values()):
+            if order.order_type == "limit":
+                if event.best_ask <= order.limit_price:
+                    self._fill(order, order.limit_price, maker=True)
+            else:
+                if not order.triggered and event.best_bid <= order.stop_price:
+                    order.triggered = True
+                if order.triggered and event.best_bid >= order.limit_price:
+                    self._fill(order, event.best_bid, maker=False)
+
+    def run(self, events: Iterable[BookEvent]) -> Dict[str, Any]:
+        open_orders = self.open_orders
+        on_event = self.strategy.on_event
+        for event in events:
+            self.events += 1
+            self.now = event.ts
+            self.last_event[event.product_id] = event
+            if open_orders.get(event.product_id):
+                self._match(event)
+            on_event(self, event)
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        account = self.account
+        marked = sum(size * (self.last_event[product_id].best_bid if product_id in self.last_event else 0.0)
+                     for product_id, size in account.positions.items())
+        fills_by_type = defaultdict(int)
+        for fill in self.fills:
+            fills_by_type[f"{fill.side} {fill.order_type}"] += 1
+        waits = [fill.wait_seconds for fill in self.fills]
+        return {
+            "events": self.events,
+            "fills": len(self.fills),
+            "fills_by_type": dict(fills_by_type),
+            "rejected_post_only": self.rejected,
+            "open_orders": sum(len(orders) for orders in self.open_orders.values()),
+            "avg_fill_wait_seconds": sum(waits) / len(waits) if waits else None,
+            "realized_pnl": account.realized_pnl,
+            "fees": account.fees,
+            "cash": account.cash,
+            "positions": {product_id: size for product_id, size in account.positions.items() if size},
+            "equity": account.cash + marked,
+        }
+
+
+# ---- strategies mirroring trade_scripts ----
+class BestBidBuyStrategy:
+    """buy_orders.buyOrder, a post-only buy of quote_size at the best bid every interval seconds"""
+
+    def __init__(self, quote_size: float = 1.0, interval: float = 3600.0, product_ids: Optional[Iterable[str]] = None):
+        self.quote_size = quote_size
+        self.interval = interval
+        self.product_ids = set(product_ids) if product_ids is not None else None
+        self.next_buy: Dict[str, float] = {}
+
+    def on_event(self, sim: BookReplay, event: BookEvent) -> None:
+        if self.product_ids is not None and event.product_id not in self.product_ids:
+            return
+        if event.ts < self.next_buy.get(event.product_id, 0.0):
+            return
+        self.next_buy[event.product_id] = event.ts + self.interval
+        # Unfilled buys are replaced, like cancelling and re-posting at the new best bid
+        for order in sim.orders(event.product_id, "BUY"):
+            sim.cancel(event.product_id, order.order_id)
+        sim.placeLimitBuy(event.product_id, event.best_bid, self.quote_size / event.best_bid)
+
+
+class WallStopStrategy:
+    """
+    StopLimitService on recorded full books, holdings bought by an inner strategy get a
+    stop-limit sell at the bid wall that is moved when the wall moves more than move_threshold.
+    """
+
+    def __init__(self, buy_strategy=None, price_window: float = 0.1, wall_factor: float = 1,
+                 tick_group: float = .01, limit_factor: float = 0.99, move_threshold: float = 0.005):
+        # Imported here so light replays do not need the trading dependencies
+        from trade_scripts.sell_orders import stopLimitPrices
+        self.stopLimitPrices = stopLimitPrices
+        self.buy_strategy = buy_strategy
+        self.wall_params = {"price_window": price_window, "wall_factor": wall_factor,
+                            "tick_group": tick_group, "limit_factor": limit_factor}
+        self.move_threshold = move_threshold
+
+    def on_event(self, sim: BookReplay, event: BookEvent) -> None:
+        if self.buy_strategy is not None:
+            self.buy_strategy.on_event(sim, event)
+        position = sim.account.positions.get(event.product_id, 0.0)
+        if event.bids is None or position <= 0:
+            return
+        order_book = {"bids": [(price, size, 0) for price, size in event.bids],
+                      "asks": [(price, size, 0) for price, size in event.asks]}
+        prices = self.stopLimitPrices(order_book, **self.wall_params)
+        if prices is None:
+            return
+        stop_price, limit_price = prices
+        sells = sim.orders(event.product_id, "SELL")
+        stops = [order for order in sells if not order.triggered]
+        # A triggered stop that did not fill yet is a live sell, only the rest of the position gets a new stop
+        size = position - sum(order.base_size for order in sells if order.triggered)
+        if stops and size > 0 and stops[0].base_size == size \
+                and abs(stop_price - stops[0].stop_price) / stops[0].stop_price < self.move_threshold:
+            return
+        for order in stops:
+            sim.cancel(event.product_id, order.order_id)
+        if size > 0:
+            sim.placeStopLimitSell(event.product_id, stop_price, limit_price, size)
+
+    def on_fill(self, sim: BookReplay, fill: Fill) -> None:
+        on_fill = getattr(self.buy_strategy, "on_fill", None)
+        if on_fill:
+            on_fill(sim, fill)
+
+
+def replay(paths: Iterable[str], strategy, **kwargs) -> Dict[str, Any]:
+    return BookReplay(strategy, **kwargs).run(mergeRecordings(paths))
+
+
+if __name__ == "__main__":
+    recordings = glob.glob("data/order_book_*.jsonl.gz")
+    result = replay(recordings, WallStopStrategy(BestBidBuyStrategy(quote_size=10, interval=3600)))
+    for key, value in result.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,87 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple, Any
+
+# Orders leaving the index once they reach one of these
+TERMINAL_STATUSES = {"FILLED", "CANCELLED", "EXPIRED", "FAILED"}
+
+IndexKey = Tuple[str, str, str, str]  # product_id, side, order_type, status
+
+
+class OpenOrderIndex:
+    """
+    In-memory index of live orders fed by the websocket user channel.
+    Orders are looked up by any combination of product, side, type and status.
+    """
+
+    def __init__(self):
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.index: Dict[IndexKey, Set[str]] = defaultdict(set)
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.lock = threading.Lock()
+        # Set once the user channel snapshot is applied, until then the index may miss orders
+        self.snapshot_loaded = threading.Event()
+
+    @staticmethod
+    def _key(order: Dict[str, Any]) -> IndexKey:
+        return order["product_id"], order["side"], order["order_type"], order["status"]
+
+    @staticmethod
+    def normalize(raw_order: Dict[str, Any]) -> Dict[str, Any]:
+        """Adds the REST field names to user channel orders so REST based code can read them"""
+        order = dict(raw_order)
+        order["side"] = (raw_order.get("order_side") or raw_order.get("side", "")).upper()
+        order["order_type"] = raw_order.get("order_type", "").upper()
+        order["status"] = raw_order.get("status", "").upper()
+        order["product_id"] = raw_order.get("product_id", "")
+        order.setdefault("created_time", raw_order.get("creation_time", ""))
+        order.setdefault("filled_size", raw_order.get("cumulative_quantity", "0"))
+        order.setdefault("average_filled_price", raw_order.get("avg_price", "0"))
+        return order
+
+    def clear(self) -> None:
+        """Drops all orders, used before a reconnect snapshot repopulates the index"""
+        with self.lock:
+            self.orders.clear()
+            self.index.clear()
+
+    def mark_snapshot_loaded(self) -> None:
+        self.snapshot_loaded.set()
+
+    def wait_for_snapshot(self, timeout: Optional[float] = None) -> bool:
+        return self.snapshot_loaded.wait(timeout)
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """callback(order) runs on the websocket thread for every order update"""
+        self.listeners.append(callback)
+
+    def apply(self, raw_order: Dict[str, Any]) -> None:
+        order = self.normalize(raw_order)
+        order_id = order.get("order_id")
+        if not order_id:
+            return
+        with self.lock:
+            previous = self.orders.pop(order_id, None)
+            if previous:
+                key = self._key(previous)
+                self.index[key].discard(order_id)
+                if not self.index[key]:
+                    del self.index[key]
+            if order["status"] not in TERMINAL_STATUSES:
+                self.orders[order_id] = order
+                self.index[self._key(order)].add(order_id)
+        for callback in self.listeners:
+            callback(order)
+
+    def query(self, product_id: Optional[str] = None, side: Optional[str] = None,
+              order_type: Optional[str] = None, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        wanted = (product_id, side and side.upper(), order_type and order_type.upper(), status and status.upper())
+        with self.lock:
+            result = []
+            for key, order_ids in self.index.items():
+                if all(want is None or want == have for want, have in zip(wanted, key)):
+                    result.extend(self.orders[order_id] for order_id in order_ids)
+            return result
+
+    def __len__(self) -> int:
+        return len(self.orders)
@@ -2,7 +2,10 @@ from datetime import datetime, timezone
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, Tuple, List, Optional, Any
+from itertools import islice
 from sortedcontainers import SortedDict
+import threading
+import time
 import gzip
 import json
 @dataclass
@@ -15,10 +18,15 @@ class BaseOrderBook:
     output_file: Optional[Path] = None
     bids: SortedDict = field(default_factory=lambda: SortedDict(lambda x: -float(x)))
     asks: SortedDict = field(default_factory=lambda: SortedDict(lambda x: float(x)))
+    # Epoch seconds of the last applied message, used for staleness checks
+    last_update: float = field(default_factory=time.time)
+    # Guards bids/asks when the book is read from another thread (price oracle)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
     def process_meta_data(self, msg: Dict) -> None:
         self.sequence_num = msg.get('sequence_num', -1)
         self.timestamp = msg.get('received_at', datetime.now(timezone.utc).isoformat())
+        self.last_update = time.time()
 
     @property
     def best_bid(self) -> Optional[float]:
@@ -48,6 +56,30 @@ class BaseOrderBook:
         total = bid_vol + ask_vol
         return bid_vol / total if total > 0 else None
 
+    def get_depth_data(self, levels: int = 10) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+        """Get top N levels of bids and asks"""
+        with self.lock:
+            return list(islice(self.bids.items(), levels)), list(islice(self.asks.items(), levels))
+
+    def quote(self, levels: int = 1) -> Dict[str, Any]:
+        """Consistent top-of-book view, safe to call from another thread"""
+        with self.lock:
+            bids = list(islice(self.bids.items(), levels))
+            asks = list(islice(self.asks.items(), levels))
+            updated = self.last_update
+        best_bid = bids[0][0] if bids else None
+        best_ask = asks[0][0] if asks else None
+        has_both = best_bid is not None and best_ask is not None
+        return {
+            "product_id": self.product_id,
+            "time": self.timestamp,
+            "bids": [{"price": str(price), "size": str(size)} for price, size in bids],
+            "asks": [{"price": str(price), "size": str(size)} for price, size in asks],
+            "mid": (best_bid + best_ask) / 2 if has_both else None,
+            "spread": best_ask - best_bid if has_both else None,
+            "age": time.time() - updated,
+        }
+
     def write_if_due(self):
         now = datetime.now(timezone.utc)
         if (now - self.last_write_time).total_seconds() >= self.write_interval:
@@ -62,26 +94,28 @@ class BaseOrderBook:
 @dataclass
 class FullOrderBookState(BaseOrderBook):
     def process_snapshot(self, msg: Dict) -> None:
-        for u in msg.get('events', [])[0]['updates']:
-            side = u.get('side')
-            price = float(u.get('price_level', 0))
-            size = float(u.get('new_quantity', 0))
-            if side == 'bid':
-                self.bids[price] = size
-            elif side == 'offer':
-                self.asks[price] = size
+        with self.lock:
+            for u in msg.get('events', [])[0]['updates']:
+                side = u.get('side')
+                price = float(u.get('price_level', 0))
+                size = float(u.get('new_quantity', 0))
+                if side == 'bid':
+                    self.bids[price] = size
+                elif side == 'offer':
+                    self.asks[price] = size
 
     def process_update(self, msg: Dict) -> None:
         self.process_meta_data(msg)
-        for u in msg.get('events', [])[0]['updates']:
-            side = u.get('side')
-            price = float(u.get('price_level', 0))
-            size = float(u.get('new_quantity', 0))
-            book = self.bids if side == 'bid' else self.asks
-            if size == 0:
-                book.pop(price, None)
-            else:
-                book[price] = size
+        with self.lock:
+            for u in msg.get('events', [])[0]['updates']:
+                side = u.get('side')
+                price = float(u.get('price_level', 0))
+                size = float(u.get('new_quantity', 0))
+                book = self.bids if side == 'bid' else self.asks
+                if size == 0:
+                    book.pop(price, None)
+                else:
+                    book[price] = size
 
     def _write_snapshot(self, now: datetime):
         data_order_book = {
@@ -106,26 +140,28 @@ class LightOrderBookState(BaseOrderBook):
     write_interval: int = 60
 
     def process_snapshot(self, msg: Dict) -> None:
-        for u in msg.get('events', [])[0]['updates']:
-            side = u.get('side')
-            price = float(u.get('price_level', 0))
-            size = float(u.get('new_quantity', 0))
-            if side == 'bid':
-                self.bids[price] = size
-            elif side == 'offer':
-                self.asks[price] = size
+        with self.lock:
+            for u in msg.get('events', [])[0]['updates']:
+                side = u.get('side')
+                price = float(u.get('price_level', 0))
+                size = float(u.get('new_quantity', 0))
+                if side == 'bid':
+                    self.bids[price] = size
+                elif side == 'offer':
+                    self.asks[price] = size
 
     def process_update(self, msg: Dict) -> None:
         self.process_meta_data(msg)
-        for u in msg.get('events', [])[0]['updates']:
-            side = u.get('side')
-            price = float(u.get('price_level', 0))
-            size = float(u.get('new_quantity', 0))
-            book = self.bids if side == 'bid' else self.asks
-            if size == 0:
-                book.pop(price, None)
-            else:
-                book[price] = size
+        with self.lock:
+            for u in msg.get('events', [])[0]['updates']:
+                side = u.get('side')
+                price = float(u.get('price_level', 0))
+                size = float(u.get('new_quantity', 0))
+                book = self.bids if side == 'bid' else self.asks
+                if size == 0:
+                    book.pop(price, None)
+                else:
+                    book[price] = size
 
     def _write_snapshot(self, now: datetime):
         if not self.output_file:
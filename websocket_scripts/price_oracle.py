@@ -0,0 +1,98 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+
+class PriceOracleServer:
+    """
+    Loopback HTTP service answering price queries from the live order books
+    kept in memory by the websocket tracker.
+
+    GET /quotes?product_ids=BTC-USD,ETH-USD&depth=5
+    returns {"pricebooks": [...]} in the same shape as the REST best_bid_ask
+    endpoint, extended with mid, spread and age (seconds since last update).
+
+    GET /orders?status=OPEN&side=SELL&order_type=STOP_LIMIT
+    returns {"orders": [...]} from the user channel OpenOrderIndex, if one is attached.
+    """
+
+    def __init__(self, order_books: Dict[str, Any], host: str = "127.0.0.1", port: int = 8765,
+                 open_orders: Optional[Any] = None):
+        self.order_books = order_books
+        self.open_orders = open_orders
+        self.host = host
+        self.port = port
+        self.httpd: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def quotes(self, product_ids: List[str], depth: int = 1) -> List[Dict[str, Any]]:
+        pricebooks = []
+        for product_id in product_ids:
+            book = self.order_books.get(product_id)
+            if book is not None:
+                pricebooks.append(book.quote(levels=depth))
+        return pricebooks
+
+    def _make_handler(self):
+        oracle = self
+
+        class QuoteHandler(BaseHTTPRequestHandler):
+            # Keep-alive so repeated lookups skip the TCP handshake
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = parse_qs(parsed.query)
+                if parsed.path == "/orders" and oracle.open_orders is not None:
+                    filters = {key: params[key][0] for key in ("product_id", "side", "order_type", "status")
+                               if key in params}
+                    self._reply(200, {"orders": oracle.open_orders.query(**filters)})
+                    return
+                if parsed.path != "/quotes":
+                    self._reply(404, {"error": f"Unknown path {parsed.path}"})
+                    return
+                product_ids = ",".join(params.get("product_ids", [])).split(",")
+                product_ids = [product_id for product_id in product_ids if product_id]
+                if not product_ids:
+                    product_ids = list(oracle.order_books.keys())
+                try:
+                    depth = max(1, int(params.get("depth", ["1"])[0]))
+                except ValueError:
+                    self._reply(400, {"error": "depth must be an integer"})
+                    return
+                self._reply(200, {"pricebooks": oracle.quotes(product_ids, depth)})
+
+            def _reply(self, status_code, body):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                # Default handler logs every request to stderr
+                logger.debug(format % args)
+
+        return QuoteHandler
+
+    def start(self):
+        if self.httpd:
+            logger.warning("Price oracle already running")
+            return
+        self.httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Price oracle serving on http://{self.host}:{self.port}/quotes")
+
+    def shutdown(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
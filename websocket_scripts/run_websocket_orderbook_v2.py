@@ -5,7 +5,7 @@ import threading
 import time
 import logging
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 from dataclasses import dataclass
 from pathlib import Path
 import queue
@@ -14,7 +14,14 @@ import queue
 from order_book_state import OrderBookState
 from order_book_classes import LightOrderBookState, FullOrderBookState, BaseOrderBook
 from price_history import PriceHistoryTracker
+from price_oracle import PriceOracleServer
+from open_orders import OpenOrderIndex
 import api_scripts.get_request as api_get
+import api_scripts.authenticate as auth
+from trade_scripts.stop_limit_service import StopLimitService
+from trade_scripts.dca_service import DCAService
+from storage_scripts.candle_store import CandleStore
+from storage_scripts.universe import Universe
 
 # Configure logging
 logging.basicConfig(
@@ -48,16 +55,22 @@ class OrderBookConfig:
 
 
 class OrderBookTracker:
-    def __init__(self, config: OrderBookConfig):
+    def __init__(self, config: OrderBookConfig, order_books: Optional[Dict[str, BaseOrderBook]] = None):
         self.config = config
         self.ws_app: Optional[websocket.WebSocketApp] = None
         self.running = threading.Event()
         self.connected = threading.Event()
         self.shutdown_requested = threading.Event()
         self.reconnect_count = 0
-        self.order_books: Dict[str, BaseOrderBook] = {}
+        # Shared between batch trackers so the price oracle sees every product
+        self.order_books: Dict[str, BaseOrderBook] = order_books if order_books is not None else {}
         self.price_histories: Dict[str, PriceHistoryTracker] = {}
         self.special_pairs = set(config.special_pairs)
+        # callback(product_id, book) after every applied level2 update
+        self.book_listeners: List[Callable[[str, BaseOrderBook], None]] = []
+
+    def add_book_listener(self, callback: Callable[[str, BaseOrderBook], None]) -> None:
+        self.book_listeners.append(callback)
 
     def _create_subscription_message(self) -> str:
         return json.dumps({
@@ -132,6 +145,8 @@ class OrderBookTracker:
         current_book = self.order_books.get(product_id)
         if current_book:
             current_book.process_update(data)
+            for callback in self.book_listeners:
+                callback(product_id, current_book)
             # Save only if it's a special pair and write interval is due
             if product_id in self.special_pairs:
                 prev_time = current_book.last_write_time
@@ -208,6 +223,8 @@ class OrderBookTracker:
         if self.running.is_set():
             logger.warning("Tracker already running")
             return
+        if self.shutdown_requested.is_set():
+            return
         self.running.set()
         self._start_websocket()
 
@@ -229,6 +246,85 @@ class OrderBookTracker:
             self.ws_app.close()
 
 
+class UserOrderTracker(OrderBookTracker):
+    """
+    Follows the authenticated user channel and keeps an OpenOrderIndex of live orders,
+    so open orders can be answered and cancelled without downloading order history.
+    """
+
+    def __init__(self, config: OrderBookConfig, open_orders: Optional[OpenOrderIndex] = None):
+        super().__init__(config)
+        self.open_orders = open_orders if open_orders is not None else OpenOrderIndex()
+
+    def _create_subscription_message(self, channel: Optional[str] = None) -> str:
+        # A fresh JWT per (re)connect, they expire after two minutes
+        return json.dumps({
+            "type": "subscribe",
+            "channel": channel or self.config.channel_name,
+            "jwt": auth.getWebsocketJWT()
+        })
+
+    def _create_unsubscription_message(self) -> str:
+        return json.dumps({
+            "type": "unsubscribe",
+            "channel": self.config.channel_name,
+            "jwt": auth.getWebsocketJWT()
+        })
+
+    def _on_open(self, ws):
+        # Orders may have closed while disconnected, the new snapshot rebuilds the index
+        self.open_orders.clear()
+        super()._on_open(ws)
+        try:
+            # Without heartbeats a quiet user channel is closed by Coinbase
+            ws.send(self._create_subscription_message("heartbeats"))
+        except Exception as e:
+            logger.error(f"Failed to subscribe to heartbeats: {e}")
+
+    def _process_message(self, data: Dict[str, Any]):
+        channel = data.get("channel")
+        if channel != "user":
+            if channel not in ("heartbeats", "subscriptions"):
+                logger.debug(f"Unknown channel: {channel}")
+            return
+        for event in data.get("events", []):
+            # Snapshots arrive in pages, both types are applied the same way
+            for order in event.get("orders", []):
+                self.open_orders.apply(order)
+            if event.get("type") == "snapshot":
+                self.open_orders.mark_snapshot_loaded()
+                logger.info(f"User order snapshot loaded, {len(self.open_orders)} open orders")
+
+
+class MarketTradesTracker(OrderBookTracker):
+    """
+    Follows the market_trades channel and hands every trade to the trade listeners,
+    callback(product_id, ts, price, size), e.g. Universe.addTrade for live volumes.
+    """
+
+    def __init__(self, config: OrderBookConfig, trade_listeners=()):
+        super().__init__(config)
+        self.trade_listeners: List[Callable[[str, float, float, float], None]] = list(trade_listeners)
+
+    def _process_message(self, data: Dict[str, Any]):
+        channel = data.get("channel")
+        if channel != "market_trades":
+            if channel not in ("heartbeats", "subscriptions"):
+                logger.debug(f"Unknown channel: {channel}")
+            return
+        for event in data.get("events", []):
+            # The snapshot repeats recent trades that happened before we connected
+            if event.get("type") != "update":
+                continue
+            for trade in event.get("trades", []):
+                try:
+                    ts = datetime.fromisoformat(trade["time"].replace("Z", "+00:00")).timestamp()
+                except (KeyError, ValueError):
+                    ts = time.time()
+                for callback in self.trade_listeners:
+                    callback(trade["product_id"], ts, float(trade["price"]), float(trade["size"]))
+
+
 # --- Helpers ---
 def chunk_list(lst, chunk_size):
     for i in range(0, len(lst), chunk_size):
@@ -242,47 +338,134 @@ def signal_handler(signum, frame):
     shutdown_event.set()
 
 
+# Running trackers, main shuts them down on a signal so their threads can be joined
+active_trackers: List[OrderBookTracker] = []
+trackers_lock = threading.Lock()
+
+def shutdown_trackers():
+    with trackers_lock:
+        trackers = list(active_trackers)
+    for tracker in trackers:
+        tracker.shutdown()
+
+
 # --- Per-batch runner ---
-def run_tracker_for_batch(product_batch, special_pairs):
+def run_tracker(tracker):
+    with trackers_lock:
+        # A tracker starting after the signal would never be shut down
+        if shutdown_event.is_set():
+            return
+        active_trackers.append(tracker)
+    try:
+        tracker.start_blocking()
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+    finally:
+        tracker.shutdown()
+
+
+def run_user_tracker(open_orders):
+    run_tracker(UserOrderTracker(OrderBookConfig(channel_name="user"), open_orders=open_orders))
+
+
+def run_tracker_for_batch(product_batch, special_pairs, order_books=None, book_listeners=()):
     orderbook_config = OrderBookConfig(
         product_ids=product_batch,
         special_pairs=special_pairs,
         channel_name="level2"
     )
-    tracker = OrderBookTracker(orderbook_config)
+    tracker = OrderBookTracker(orderbook_config, order_books=order_books)
+    for callback in book_listeners:
+        tracker.add_book_listener(callback)
+    run_tracker(tracker)
+
+
+def run_trades_for_batch(product_batch, trade_listeners):
+    trades_config = OrderBookConfig(product_ids=product_batch, channel_name="market_trades")
+    run_tracker(MarketTradesTracker(trades_config, trade_listeners=trade_listeners))
+
+
+def refresh_universe(universe):
     try:
-        tracker.start_blocking()
+        # Stored candles and a new stats snapshot replace the traded volumes, the result is saved
+        universe.refresh()
+        logger.info(f"Universe refreshed, {len(universe.above())} pairs above the volume threshold")
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-    finally:
-        tracker.shutdown()
+        logger.error(f"Universe refresh failed: {e}")
 
 
 # --- Main ---
-def main():
+def main(stop_limit_service=False, post_new_orders=False, dca_schedules=None, universe=None,
+         universe_interval=3600.0):
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
     special_pairs = ["BTC-USD", "ETH-USD", "SOL-USD", "ADA-USD", "XRP-USD"]
     usdc_pairs = api_get.getTradePairs(fiat_currency="USD")
 
+    # All batches write into one dict which the local price oracle reads from
+    order_books: Dict[str, BaseOrderBook] = {}
+    open_orders = OpenOrderIndex()
+    price_oracle = PriceOracleServer(order_books, open_orders=open_orders)
+    price_oracle.start()
 
     max_per_ws = 20
-    threads = []
+    threads = [threading.Thread(target=run_user_tracker, args=(open_orders,))]
+    threads[0].start()
+
+    # Re-anchors stop-limit sells on the live books instead of REST snapshots
+    book_listeners = []
+    stop_service = None
+    if stop_limit_service:
+        stop_service = StopLimitService(order_books, open_orders=open_orders, post_new_orders=post_new_orders)
+        book_listeners.append(stop_service.on_book_update)
+    # Dip-target DCA buys triggered by book updates and followed through order updates
+    dca_service = None
+    if dca_schedules:
+        dca_service = DCAService(dca_schedules, order_books, post_new_orders=post_new_orders)
+        book_listeners.append(dca_service.on_book_update)
+        open_orders.add_listener(dca_service.on_order_update)
 
     for batch in chunk_list(usdc_pairs, max_per_ws):
-        t = threading.Thread(target=run_tracker_for_batch, args=(batch, special_pairs))
+        t = threading.Thread(target=run_tracker_for_batch,
+                             args=(batch, special_pairs, order_books, book_listeners))
         t.start()
         threads.append(t)
         time.sleep(1)  # stagger connections to avoid rate limits
-
-    # Wait for shutdown signal
-    shutdown_event.wait()
+        # Live trades keep the volume universe current between candle refreshes
+        if universe is not None:
+            t = threading.Thread(target=run_trades_for_batch, args=(batch, [universe.addTrade]))
+            t.start()
+            threads.append(t)
+            time.sleep(1)
+
+    if stop_service:
+        stop_service.start()
+    if dca_service:
+        dca_service.start()
+
+    # Wait for shutdown signal, the universe is refreshed and saved meanwhile
+    if universe is not None:
+        refresh_universe(universe)
+        while not shutdown_event.wait(timeout=universe_interval):
+            refresh_universe(universe)
+    else:
+        shutdown_event.wait()
     logger.info("Shutdown signal received, stopping trackers...")
 
+    if stop_service:
+        stop_service.stop()
+    if dca_service:
+        dca_service.stop()
+    shutdown_trackers()
     for t in threads:
         t.join()
+    if universe is not None:
+        # Trades since the last refresh
+        universe.save()
+    price_oracle.shutdown()
 
 
 if __name__ == "__main__":
-    main()
+    # Run from websocket_scripts, data lives one folder up
+    main(universe=Universe(CandleStore("../data/candle_store"), "../data/universe.json"))
@@ -0,0 +1,87 @@
+from typing import Dict, Iterable, Optional, Tuple, Any
+import numpy as np
+
+
+def levelArrays(book, side: str, levels: int = 1000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Price and size arrays of the side an order of `side` would take from.
+    Accepts a live order book (get_depth_data) or a REST level2 dict.
+    """
+    if isinstance(book, dict):
+        book_levels = book["asks"] if side == "buy" else book["bids"]
+        book_levels = [(level[0], level[1]) for level in book_levels[:levels]]
+    else:
+        bids, asks = book.get_depth_data(levels)
+        book_levels = asks if side == "buy" else bids
+    if not book_levels:
+        return np.empty(0), np.empty(0)
+    prices, sizes = np.asarray(book_levels, dtype=np.float64).T
+    return prices, sizes
+
+
+def walkBook(prices: np.ndarray, sizes: np.ndarray, order_sizes: Iterable[float],
+             side: str = "buy", quote: bool = False) -> Dict[str, np.ndarray]:
+    """
+    Walks one side of the book for all order sizes at once.
+    order_sizes are base amounts, or quote (USD) amounts when quote=True.
+    Sizes deeper than the book get nan prices and filled=False.
+    """
+    order_sizes = np.asarray(list(order_sizes), dtype=np.float64)
+    if prices.size == 0:
+        nan = np.full(order_sizes.shape, np.nan)
+        return {"avg_price": nan, "slippage_bps": nan, "levels": np.zeros(order_sizes.shape, dtype=np.int64),
+                "base_size": nan, "filled": np.zeros(order_sizes.shape, dtype=bool)}
+
+    cum_size = np.cumsum(sizes)
+    cum_notional = np.cumsum(prices * sizes)
+    # Cumulative amounts before each level, so partial fills of level i add to these
+    prev_size = np.concatenate(([0.0], cum_size[:-1]))
+    prev_notional = np.concatenate(([0.0], cum_notional[:-1]))
+
+    cumulative = cum_notional if quote else cum_size
+    idx = np.searchsorted(cumulative, order_sizes, side="left")
+    filled = idx < prices.size
+    idx = np.minimum(idx, prices.size - 1)
+
+    if quote:
+        remaining = order_sizes - prev_notional[idx]
+        base_size = prev_size[idx] + remaining / prices[idx]
+        notional = order_sizes
+    else:
+        remaining = order_sizes - prev_size[idx]
+        base_size = order_sizes
+        notional = prev_notional[idx] + remaining * prices[idx]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_price = np.where(filled, notional / base_size, np.nan)
+    best_price = prices[0]
+    direction = 1.0 if side == "buy" else -1.0
+    slippage_bps = direction * (avg_price - best_price) / best_price * 1e4
+    return {
+        "avg_price": avg_price,
+        "slippage_bps": slippage_bps,
+        "levels": np.where(filled, idx + 1, prices.size),
+        "base_size": np.where(filled, base_size, np.nan),
+        "filled": filled,
+    }
+
+
+def estimateSlippage(books: Dict[str, Any], order_sizes: Iterable[float], side: str = "buy",
+                     quote: bool = False, product_ids: Optional[Iterable[str]] = None,
+                     levels: int = 1000) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Expected average fill price, slippage versus the touch in bps and levels consumed
+    for every order size on every product, e.g.
+    estimateSlippage(tracker.order_books, [100, 1000, 10000], side="buy", quote=True)
+    """
+    order_sizes = list(order_sizes)
+    side = side.lower()
+    product_ids = product_ids if product_ids is not None else list(books.keys())
+    result = {}
+    for product_id in product_ids:
+        book = books.get(product_id)
+        if book is None:
+            continue
+        prices, sizes = levelArrays(book, side, levels)
+        result[product_id] = walkBook(prices, sizes, order_sizes, side, quote)
+    return result